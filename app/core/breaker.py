@@ -0,0 +1,60 @@
+import time
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_after: float):
+        """
+        Raised instead of calling a dependency which is failing
+        :param name: str, name of the circuit
+        :param retry_after: float, seconds before the next probe
+        """
+        super().__init__(f"{name} unavailable, retry in {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+    def __init__(self, name: str, threshold: int, reset_timeout: float):
+        """
+        Stop calling a dependency after threshold failures in a row. Once reset_timeout seconds
+        have passed, one call is let through to probe it: its success closes the circuit again
+        :param name: str
+        :param threshold: int, failures in a row opening the circuit
+        :param reset_timeout: float, seconds before probing the dependency
+        """
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.closed
+        self.failures = 0
+        self._opened_at = 0.0
+
+    def before(self):
+        """
+        Check the dependency can be called, raise CircuitOpenError if not
+        :return:
+        """
+        if self.state == self.closed:
+            return
+        now = time.monotonic()
+        wait = self._opened_at + self.reset_timeout - now
+        if wait <= 0:
+            # Probe, the next one only comes after reset_timeout if this one never ends
+            self.state = self.half_open
+            self._opened_at = now
+            return
+        raise CircuitOpenError(self.name, wait)
+
+    def success(self):
+        self.state = self.closed
+        self.failures = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.state == self.half_open or self.failures >= self.threshold:
+            self.state = self.open
+            self._opened_at = time.monotonic()
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app.core.config import settings
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        """
+        In-process cache with a time to live and least recently used eviction
+        :param maxsize: int, maximum number of entries
+        :param ttl: float, time to live of an entry in seconds
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Value of the key if present and not expired
+        :param key: Hashable
+        :return: value or None
+        """
+        if key not in self._data:
+            return None
+        expire, value = self._data[key]
+        if expire < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Store the value, the least recently used entry is evicted if the cache is full
+        :param key: Hashable
+        :param value: Any
+        :return:
+        """
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Validated OC tokens: sha256 of the token -> UserAuth
+token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+# Same, kept longer to authenticate when OC cannot validate tokens
+stale_token_cache = TTLCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_STALE_TTL)
@@ -22,6 +22,49 @@ class Settings(BaseSettings):
     MONGO_STUDENT_COLL: Optional[str] = "students"
     MONGO_SESSION_COLL: Optional[str] = "sessions"
     MONGO_INVOICE_COLL: Optional[str] = "invoices"
+    MONGO_SYNC_COLL: Optional[str] = "sync_state"
+    MONGO_ROLLUP_COLL: Optional[str] = "billing_rollup"
+    MONGO_JOB_COLL: Optional[str] = "jobs"
+    MONGO_PDF_BUCKET: Optional[str] = "invoice_pdf"
+    MONGO_COOKIE_COLL: Optional[str] = "cookies"
+    INVOICE_MAX_GROUPS: Optional[int] = 100
+    INVOICE_BATCH_MAX_MONTHS: Optional[int] = 24
+    PAGE_SIZE: Optional[int] = 100
+    PAGE_SIZE_MAX: Optional[int] = 1000
+    TOKEN_CACHE_TTL: Optional[float] = 300
+    TOKEN_CACHE_SIZE: Optional[int] = 256
+    TOKEN_STALE_TTL: Optional[float] = 86400
+    OC_API_URL: Optional[str] = "https://api.openclassrooms.com"
+    OC_WEBSITE_URL: Optional[str] = "https://openclassrooms.com"
+    OC_MAX_CONNECTIONS: Optional[int] = 20
+    OC_MAX_KEEPALIVE: Optional[int] = 10
+    OC_KEEPALIVE_EXPIRY: Optional[float] = 30
+    OC_CONNECT_TIMEOUT: Optional[float] = 5
+    OC_READ_TIMEOUT: Optional[float] = 30
+    OC_RATE_LIMIT: Optional[float] = 10
+    OC_RATE_BURST: Optional[float] = 20
+    OC_RETRIES: Optional[int] = 3
+    OC_BACKOFF_BASE: Optional[float] = 0.5
+    OC_BACKOFF_MAX: Optional[float] = 30
+    OC_BREAKER_THRESHOLD: Optional[int] = 5
+    OC_BREAKER_RESET: Optional[float] = 30
+    OC_SYNC_CONCURRENCY: Optional[int] = 5
+    OC_DASHBOARD_MAX_SIZE: Optional[int] = 2_000_000
+    SYNC_SLACK_HOURS: Optional[int] = 24
+    SYNC_SCHEDULER: Optional[bool] = True
+    SYNC_INTERVAL: Optional[float] = 3600
+    SYNC_JITTER: Optional[float] = 0.1
+    SYNC_BACKOFF_BASE: Optional[float] = 60
+    SYNC_BACKOFF_MAX: Optional[float] = 21600
+    PDF_WORKERS: Optional[int] = 2
+    PDF_QUEUE_SIZE: Optional[int] = 10
+    PDF_TIMEOUT: Optional[float] = 60
+    PDF_RETRY_AFTER: Optional[float] = 5
+    HTML_CACHE_SIZE: Optional[int] = 256
+    HTML_CACHE_TTL: Optional[float] = 86400
+    STUDENT_REFRESH_TTL_HOURS: Optional[int] = 168
+    STUDENT_REFRESH_INTERVAL: Optional[float] = 3600
+    STUDENT_REFRESH_RATE: Optional[float] = 1
 
 
 settings = Settings()
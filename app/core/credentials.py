@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+
+from app.core.breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.db import MongoDB, mongodb
+from app.core.http import oc_client
+from app.schema.authentification import UserAuth
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialStore:
+    def __init__(self):
+        """
+        OC session cookie and access token of each mentor, by mentor id.
+        Loaded from DB once, every change is written through to DB
+        """
+        self._credentials: Dict[int, dict] = {}
+
+    async def load(self, mongo: MongoDB = mongodb):
+        """
+        Load the credentials of every mentor from DB (on app startup),
+        the credentials saved before they were stored by mentor are migrated
+        :param mongo: MongoDB
+        :return:
+        """
+        self._credentials = {cookies["id"]: {"PHPSESSID": cookies["PHPSESSID"],
+                                             "access_token": cookies["access_token"]}
+                             for cookies in await mongo.get_cookies()}
+        if legacy := await mongo.get_legacy_cookies():
+            await self.migrate(legacy, mongo)
+
+    async def migrate(self, cookies: dict, mongo: MongoDB = mongodb) -> Optional[int]:
+        """
+        Store by mentor the credentials saved without mentor id, the id is asked to OC /me.
+        They are kept as they are if OC can not answer, to try again on the next startup,
+        and deleted if OC refuses the token: the mentor has to log in again
+        :param cookies: dict, PHPSESSID and access_token
+        :param mongo: MongoDB
+        :return: int, mentor id or None if not migrated
+        """
+        try:
+            req = await oc_client.get(settings.OC_API_URL + '/me',
+                                      headers={'Authorization': 'Bearer ' + cookies["access_token"]})
+        except (CircuitOpenError, httpx.TransportError) as error:
+            logger.warning("OC unavailable, credentials without mentor id kept for the next startup: %r", error)
+            return None
+        if req.status_code == 200:
+            id = req.json()["id"]
+            await self.save(id, cookies["PHPSESSID"], cookies["access_token"], mongo)
+            logger.info("Credentials without mentor id migrated to mentor %s", id)
+            return id
+        if req.status_code in (401, 403):
+            await mongo.delete_legacy_cookies()
+            logger.warning("Credentials without mentor id refused by OC and deleted, the mentor has to log in again")
+        else:
+            logger.warning("OC answered %s, credentials without mentor id kept for the next startup", req.status_code)
+        return None
+
+    async def save(self, id: int, cookie: str, token: str, mongo: MongoDB = mongodb):
+        """
+        Save the credentials of a mentor in memory and in DB
+        :param id: int, mentor id
+        :param cookie: str, PHPSESSID
+        :param token: str, access token
+        :param mongo: MongoDB
+        :return:
+        """
+        self._credentials[id] = {"PHPSESSID": cookie, "access_token": token}
+        await mongo.save_cookies({"id": id, **self._credentials[id]})
+
+    def get_cookie(self, id: int) -> Optional[str]:
+        """
+        Session cookie of a mentor
+        :param id: int, mentor id
+        :return: str or None if the mentor never logged in
+        """
+        if credentials := self._credentials.get(id):
+            return credentials["PHPSESSID"]
+
+    def get_token(self, id: Optional[int] = None) -> Optional[str]:
+        """
+        Access token of a mentor
+        :param id: int, mentor id, any mentor if None
+        :return: str or None if the mentor never logged in
+        """
+        if id is None:
+            id = next(iter(self._credentials), None)
+        if credentials := self._credentials.get(id):
+            return credentials["access_token"]
+
+    def user(self, id: int) -> Optional[UserAuth]:
+        """
+        Mentor authenticated with its stored credentials, for the work done without a request
+        :param id: int, mentor id
+        :return: UserAuth or None if the mentor never logged in
+        """
+        if credentials := self._credentials.get(id):
+            return UserAuth(username="", token=credentials["access_token"], id=id, cookie=credentials["PHPSESSID"])
+
+    def ids(self) -> List[int]:
+        """
+        Mentors with credentials
+        :return: list of mentor id
+        """
+        return list(self._credentials)
+
+
+credentials = CredentialStore()
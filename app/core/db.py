@@ -1,57 +1,173 @@
+import logging
+from typing import Dict, List, Tuple, Optional, AsyncIterator
+
 import motor.motor_asyncio
+from bson import ObjectId
+from pymongo import IndexModel, ASCENDING
+from pymongo.errors import OperationFailure
 
 from app.core.config import settings
+from app.core.utils import encode_cursor
+
+logger = logging.getLogger(__name__)
 
 
 class MongoDB:
     def __init__(self, url: str, db_name: str, student_coll: str,
-                 session_coll: str, invoice_coll: str):
+                 session_coll: str, invoice_coll: str, sync_coll: str = "sync_state",
+                 rollup_coll: str = "billing_rollup", job_coll: str = "jobs", pdf_bucket: str = "invoice_pdf",
+                 cookie_coll: str = "cookies"):
         self.client = motor.motor_asyncio.AsyncIOMotorClient(url)
         self.db = self.client[db_name]
         self.student_coll = self.db[student_coll]
         self.session_coll = self.db[session_coll]
         self.invoice_coll = self.db[invoice_coll]
+        self.sync_coll = self.db[sync_coll]
+        self.rollup_coll = self.db[rollup_coll]
+        self.job_coll = self.db[job_coll]
+        self.cookie_coll = self.db[cookie_coll]
+        self.pdf_bucket_name = pdf_bucket
+        self._pdf_bucket = None
+
+    @property
+    def pdf_bucket(self) -> motor.motor_asyncio.AsyncIOMotorGridFSBucket:
+        """
+        GridFS bucket of the invoice PDFs, the invoices only keep the id of their file
+        :return: AsyncIOMotorGridFSBucket
+        """
+        if self._pdf_bucket is None:
+            self._pdf_bucket = motor.motor_asyncio.AsyncIOMotorGridFSBucket(self.db, bucket_name=self.pdf_bucket_name)
+        return self._pdf_bucket
+
+    @property
+    def indexes(self) -> Dict[str, List[IndexModel]]:
+        """
+        Indexes required by the queries of the API, by collection name
+        :return: dict
+        """
+        return {
+            self.student_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                                     IndexModel([("email", ASCENDING)], name="email")],
+            self.session_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                                     IndexModel([("recipient", ASCENDING), ("status", ASCENDING)],
+                                                name="recipient_status"),
+                                     IndexModel([("status", ASCENDING), ("sessionDate", ASCENDING)],
+                                                name="status_sessionDate")],
+            self.invoice_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                                     IndexModel([("date", ASCENDING)], name="date_unique", unique=True)],
+            self.sync_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+            self.rollup_coll.name: [IndexModel([("yearmonth", ASCENDING), ("projectLevel", ASCENDING),
+                                                ("type", ASCENDING), ("status", ASCENDING),
+                                                ("student_status", ASCENDING)], name="group_unique", unique=True)],
+            self.job_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+                                 IndexModel([("status", ASCENDING)], name="status")],
+            self.cookie_coll.name: [IndexModel([("id", ASCENDING)], name="id_unique", unique=True)],
+        }
+
+    async def ensure_indexes(self) -> Dict[str, List[str]]:
+        """
+        Create the missing indexes, indexes already present are left untouched
+        :return: dict, name of the indexes created by collection
+        """
+        created = {}
+        for coll, indexes in self.indexes.items():
+            try:
+                created[coll] = await self.db[coll].create_indexes(indexes)
+            except OperationFailure as error:
+                logger.error("Could not create indexes on %s: %s", coll, error)
+                created[coll] = []
+        return created
+
+    async def check_indexes(self) -> Dict[str, Dict[str, List[str]]]:
+        """
+        Compare the indexes in DB with the indexes required
+        :return: dict, missing and extra indexes by collection
+        """
+        report = {}
+        for coll, indexes in self.indexes.items():
+            expected = {index.document["name"] for index in indexes} | {"_id_"}
+            present = set(await self.db[coll].index_information())
+            report[coll] = {"missing": sorted(expected - present),
+                            "extra": sorted(present - expected)}
+        return report
 
     async def get_by_id(self, coll: str, id: int):
         if document := await self.db[coll].find_one({"id": id}):
             return document
 
+    @staticmethod
+    async def find_page(coll, query: dict, after: Optional[ObjectId] = None,
+                        limit: int = settings.PAGE_SIZE,
+                        projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        Fetch a page of documents ordered by _id (keyset pagination)
+        :param coll: collection
+        :param query: dict, filter
+        :param after: _id of the last document of the previous page
+        :param limit: int, size of the page
+        :param projection: dict, fields returned, _id is always kept for the cursor
+        :return: documents of the page, cursor of the next page or None if last page
+        """
+        if after is not None:
+            query = {"$and": [query, {"_id": {"$gt": after}}]}
+        if projection is not None:
+            projection = {**projection, "_id": 1}
+        documents = await coll.find(query, projection).sort("_id", ASCENDING).limit(limit + 1).to_list(length=limit + 1)
+        if len(documents) > limit:
+            return documents[:limit], encode_cursor(documents[limit - 1]["_id"])
+        return documents, None
+
+    @staticmethod
+    async def stream(coll, query: dict, projection: Optional[dict] = None) -> AsyncIterator[dict]:
+        """
+        Iterate over all documents matching the query, ordered by _id, without loading them in memory
+        :param coll: collection
+        :param query: dict, filter
+        :param projection: dict, fields returned
+        :return: documents
+        """
+        async for document in coll.find(query, projection).sort("_id", ASCENDING):
+            yield document
+
     async def save_cookies(self, cookies):
         """
-        Delete cookies and save the on in parameter in DB
-        :param cookies: dict, cookies to be saved
+        Save the cookies of a mentor in DB, replacing its previous ones
+        :param cookies: dict, cookies to be saved with the mentor id
         :return:
         """
-        await self.db.cookies.delete_many({})
-        await self.db.cookies.insert_one(cookies)
+        # Cookies saved before they were stored by mentor
+        await self.cookie_coll.delete_many({"id": {"$exists": False}})
+        await self.cookie_coll.replace_one({"id": cookies["id"]}, cookies, upsert=True)
+
+    async def get_cookies(self) -> List[dict]:
+        """
+        Retrieve cookies of every mentor from DB
+        :return: list of dict
+        """
+        return [document async for document in self.cookie_coll.find({"id": {"$exists": True}})]
 
-    async def get_cookies(self):
+    async def get_legacy_cookies(self) -> Optional[dict]:
         """
-        Retrieve cookies from DB
-        :return: str
+        Retrieve the cookies saved before they were stored by mentor, without mentor id
+        :return: dict or None if there is none
         """
-        cursor = self.db.cookies.find()
-        cookies = []
-        for document in await cursor.to_list(length=100):
-            cookies.append(document)
-        if cookies:
-            return cookies[0]['PHPSESSID']
+        return await self.cookie_coll.find_one({"id": {"$exists": False}})
 
-    async def get_token(self):
+    async def delete_legacy_cookies(self):
         """
-        Retrieve token from DB
-        :return: str
+        Delete the cookies saved before they were stored by mentor
+        :return:
         """
-        cursor = self.db.cookies.find()
-        cookies = []
-        for document in await cursor.to_list(length=100):
-            cookies.append(document)
-        if cookies:
-            return cookies[0]['access_token']
+        await self.cookie_coll.delete_many({"id": {"$exists": False}})
 
 
 mongodb = MongoDB(settings.MONGO_URL,
                   settings.MONGO_DB,
                   settings.MONGO_STUDENT_COLL,
                   settings.MONGO_SESSION_COLL,
-                  settings.MONGO_INVOICE_COLL)
+                  settings.MONGO_INVOICE_COLL,
+                  settings.MONGO_SYNC_COLL,
+                  settings.MONGO_ROLLUP_COLL,
+                  settings.MONGO_JOB_COLL,
+                  settings.MONGO_PDF_BUCKET,
+                  settings.MONGO_COOKIE_COLL)
@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.core.breaker import CircuitBreaker
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# The request was never sent, it can be sent again whatever its method
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        """
+        Rate limit: rate requests per second on average, up to capacity requests in a burst
+        :param rate: float, tokens added per second
+        :param capacity: float, maximum number of tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """
+        Wait for a token
+        :return:
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Stop giving tokens for a while, when the host asked to slow down
+        :param seconds: float
+        :return:
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    """
+    Seconds to wait from the Retry-After header, in seconds or as a date
+    :param response: httpx.Response
+    :return: float or None if there is no valid header
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class OCClient:
+    def __init__(self, max_connections: int, max_keepalive: int, keepalive_expiry: float,
+                 connect_timeout: float, read_timeout: float, rate: float, burst: float,
+                 retries: int, backoff_base: float, backoff_max: float,
+                 breaker_threshold: int, breaker_reset: float):
+        """
+        Outbound policy of every call to OC: connection pool, timeouts, rate limit by host,
+        retries with backoff of the idempotent requests and a circuit breaker by family of endpoints
+        :param max_connections: int
+        :param max_keepalive: int
+        :param keepalive_expiry: float, seconds
+        :param connect_timeout: float, seconds
+        :param read_timeout: float, seconds
+        :param rate: float, requests per second by host
+        :param burst: float, requests in a burst by host
+        :param retries: int, retries after the first attempt
+        :param backoff_base: float, seconds before the first retry, doubled at each retry
+        :param backoff_max: float, maximum seconds between two attempts
+        :param breaker_threshold: int, requests failed in a row opening the circuit of a family
+        :param breaker_reset: float, seconds before probing a family again
+        """
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=keepalive_expiry)
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.rate = rate
+        self.burst = burst
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.breakers = {family: CircuitBreaker(family, breaker_threshold, breaker_reset)
+                         for family in ("auth", "sessions", "website")}
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        Shared AsyncClient, its pool keeps connections alive for both
+        openclassrooms.com and api.openclassrooms.com
+        :return: httpx.AsyncClient
+        """
+        if self._client is None or self._client.is_closed:
+            # Never store cookies on the shared client: the pool is used for every mentor
+            self._client = httpx.AsyncClient(limits=self.limits,
+                                             timeout=self.timeout,
+                                             cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])))
+        return self._client
+
+    async def start(self):
+        """
+        Open the connection pool (on app startup)
+        :return:
+        """
+        return self.client
+
+    async def close(self):
+        """
+        Close the connection pool (on app shutdown)
+        :return:
+        """
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def bucket(self, url: str) -> TokenBucket:
+        """
+        Rate limit of the host of the url
+        :param url: str
+        :return: TokenBucket
+        """
+        host = httpx.URL(url).host
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    def breaker(self, url: str) -> CircuitBreaker:
+        """
+        Circuit breaker of the family of the url: auth (/me), sessions (api) or website (scraping)
+        :param url: str
+        :return: CircuitBreaker
+        """
+        url = httpx.URL(url)
+        if url.host != httpx.URL(settings.OC_API_URL).host:
+            return self.breakers["website"]
+        if url.path == "/me":
+            return self.breakers["auth"]
+        return self.breakers["sessions"]
+
+    @staticmethod
+    def record(breaker: CircuitBreaker, response: httpx.Response):
+        # OC rate limiting (429) is handled by the retries, only server errors mean OC is down
+        if response.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+
+    def backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """
+        Seconds to wait before the next attempt: Retry-After of the response if any,
+        else a random delay up to backoff_base doubled at each attempt
+        :param attempt: int, attempts already made
+        :param response: httpx.Response, response of the last attempt
+        :return: float
+        """
+        if response is not None and (delay := retry_after(response)) is not None:
+            return min(delay, self.backoff_max)
+        return random.uniform(0, min(self.backoff_base * 2 ** (attempt - 1), self.backoff_max))
+
+    def should_retry(self, method: str, attempt: int, response: Optional[httpx.Response] = None,
+                     error: Optional[httpx.TransportError] = None) -> bool:
+        """
+        Only the idempotent requests are sent again, unless the previous attempt never reached OC
+        :param method: str
+        :param attempt: int, attempts already made
+        :param response: httpx.Response, response of the last attempt
+        :param error: httpx.TransportError, error of the last attempt
+        :return: bool
+        """
+        if attempt > self.retries:
+            return False
+        if error is not None:
+            return isinstance(error, NOT_SENT_ERRORS) or method in IDEMPOTENT_METHODS
+        return method in IDEMPOTENT_METHODS and response.status_code in RETRY_STATUS
+
+    async def _wait(self, url: str, attempt: int, response: Optional[httpx.Response] = None):
+        delay = self.backoff(attempt, response)
+        if response is not None and response.status_code == 429:
+            # Slow down every request to the host, not only this one
+            self.bucket(url).pause(delay)
+        logger.info("Attempt %s on %s failed, retry in %.1fs", attempt, url, delay)
+        await asyncio.sleep(delay)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a request under the outbound policy,
+        raise CircuitOpenError at once if its family of endpoints is failing
+        :param method: str
+        :param url: str
+        :return: httpx.Response, the last one if every attempt failed
+        """
+        breaker = self.breaker(url)
+        breaker.before()
+        try:
+            response = await self._request(method.upper(), url, **kwargs)
+        except httpx.TransportError:
+            breaker.failure()
+            raise
+        self.record(breaker, response)
+        return response
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.bucket(url).acquire()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as error:
+                if not self.should_retry(method, attempt, error=error):
+                    raise
+                await self._wait(url, attempt)
+                continue
+            if not self.should_retry(method, attempt, response=response):
+                return response
+            await self._wait(url, attempt, response)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        """
+        Send a request under the outbound policy without reading the body, to use with async with.
+        Once the response is given, errors while reading the body are not retried
+        :param method: str
+        :param url: str
+        :return: httpx.Response
+        """
+        method = method.upper()
+        breaker = self.breaker(url)
+        breaker.before()
+        attempt, streaming = 0, False
+        while True:
+            attempt += 1
+            await self.bucket(url).acquire()
+            try:
+                async with self.client.stream(method, url, **kwargs) as response:
+                    if not self.should_retry(method, attempt, response=response):
+                        self.record(breaker, response)
+                        streaming = True
+                        yield response
+                        return
+            except httpx.TransportError as error:
+                if streaming:
+                    raise
+                if not self.should_retry(method, attempt, error=error):
+                    breaker.failure()
+                    raise
+                response = None
+            await self._wait(url, attempt, response)
+
+
+def cookie_header(cookie: str) -> dict:
+    """
+    Build the header for the OC website session cookie
+    :param cookie: str, PHPSESSID
+    :return: dict
+    """
+    return {"Cookie": "PHPSESSID=" + str(cookie)}
+
+
+oc_client = OCClient(settings.OC_MAX_CONNECTIONS,
+                     settings.OC_MAX_KEEPALIVE,
+                     settings.OC_KEEPALIVE_EXPIRY,
+                     settings.OC_CONNECT_TIMEOUT,
+                     settings.OC_READ_TIMEOUT,
+                     settings.OC_RATE_LIMIT,
+                     settings.OC_RATE_BURST,
+                     settings.OC_RETRIES,
+                     settings.OC_BACKOFF_BASE,
+                     settings.OC_BACKOFF_MAX,
+                     settings.OC_BREAKER_THRESHOLD,
+                     settings.OC_BREAKER_RESET)
@@ -1,24 +1,223 @@
-from typing import List
+import base64
+import binascii
+import hashlib
+import json
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, List, Tuple, AsyncIterable, AsyncIterator, Iterable, Optional, Type
 
-from app.schema.invoice import InvoiceItem
+from bson import ObjectId
+from bson.errors import InvalidId
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+
+from app.core.config import settings
+from app.schema.invoice import InvoiceItem, InvoiceOutModel
+
+logger = logging.getLogger(__name__)
+
+
+class Progress:
+    def __init__(self, counters: Optional[Dict[str, int]] = None):
+        """
+        Counters of the work done by an operation
+        :param counters: dict, counters updated in place
+        """
+        self.counters = {} if counters is None else counters
+
+    def add(self, name: str, count: int = 1):
+        """
+        Increment a counter
+        :param name: str
+        :param count: int
+        :return:
+        """
+        self.counters[name] = self.counters.get(name, 0) + count
 
 
 def get_range(r_min, r_max, step=19) -> List[dict]:
     """
-    For a list of dict (range_min and range_max) from parameters
+    For a list of dict (range_min and range_max) from parameters,
+    windows are inclusive and cover every item from r_min to r_max (excluded)
     :param r_min: start of range
-    :param r_max: end of range
+    :param r_max: end of range (number of items)
     :param step: size of range
     :return:
     """
     output = []
-    complete_range = (r_max - r_min) // step + 1
-    for i in range(complete_range):
-        output.append({"range_min": i * (step + 1),
-                       "range_max": (i + 1) * step + i})
+    for range_min in range(r_min, r_max, step + 1):
+        output.append({"range_min": range_min,
+                       "range_max": min(range_min + step, r_max - 1)})
+    return output
+
+
+def merge_pages(pages: List[list]) -> List[dict]:
+    """
+    Merge pages of sessions in order, a session present in several pages is kept once
+    :param pages: list of pages (list of sessions)
+    :return: list of sessions
+    """
+    seen, output = set(), []
+    for page in pages:
+        for session in page:
+            if session["id"] not in seen:
+                seen.add(session["id"])
+                output.append(session)
     return output
 
 
+def encode_cursor(last_id: ObjectId) -> str:
+    """
+    Opaque pagination cursor from the _id of the last document of a page
+    :param last_id: ObjectId
+    :return: str
+    """
+    return base64.urlsafe_b64encode(last_id.binary).decode()
+
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """
+    _id of the last document of the previous page from a pagination cursor
+    :param cursor: str
+    :return: ObjectId
+    """
+    try:
+        return ObjectId(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise ValueError("Invalid cursor " + cursor)
+
+
+def _model_fields(model: Type[BaseModel], prefix: str = "") -> List[str]:
+    fields = []
+    for field in model.__fields__.values():
+        name = prefix + field.alias
+        if field.shape == SHAPE_SINGLETON and isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            fields += _model_fields(field.type_, name + ".")
+        else:
+            fields.append(name)
+    return fields
+
+
+@lru_cache()
+def model_projection(model: Type[BaseModel]) -> dict:
+    """
+    Projection of the fields of a model, to only read from DB what the model keeps.
+    Fields of nested models are projected one by one, lists are projected whole.
+    _id is left out, the projection must not be modified
+    :param model: pydantic model
+    :return: dict, projection
+    """
+    return {"_id": 0, **{field: 1 for field in _model_fields(model)}}
+
+
+async def to_ndjson(models: AsyncIterable[BaseModel]) -> AsyncIterator[str]:
+    """
+    Serialize models as newline delimited json, one line at a time
+    :param models: models to serialize
+    :return: str, one line per model
+    """
+    async for model in models:
+        yield model.json() + "\n"
+
+
+def to_naive_utc(date: datetime) -> datetime:
+    """
+    Convert a datetime to a naive UTC datetime (as returned by MongoDB)
+    :param date: datetime
+    :return: datetime
+    """
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def month_range(date: str) -> Tuple[datetime, datetime]:
+    """
+    Half-open range of dates of a month
+    :param date: str, month in format YYYY-MM
+    :return: first instant of the month, first instant of the next month
+    """
+    start = datetime.strptime(date, "%Y-%m")
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def month_list(start: str, end: str) -> List[str]:
+    """
+    Every month between two months
+    :param start: str, first month in format YYYY-MM
+    :param end: str, last month in format YYYY-MM (included)
+    :return: list of months in format YYYY-MM
+    """
+    months, month = [], month_range(start)[0]
+    while month <= month_range(end)[0]:
+        months.append(month.strftime("%Y-%m"))
+        month = month_range(months[-1])[1]
+    return months
+
+
+async def as_async(items: Iterable) -> AsyncIterator:
+    """
+    Iterate asynchronously over an iterable
+    :param items: Iterable
+    :return: items
+    """
+    for item in items:
+        yield item
+
+
+def invoice_content_hash(invoice: InvoiceOutModel, template_version: str) -> str:
+    """
+    Hash of everything a rendered invoice depends on: items, total, status and template
+    :param invoice: InvoiceOutModel
+    :param template_version: str, hash of the template
+    :return: str, hex digest
+    """
+    # InvoiceItem only has scalar fields, its __dict__ is its dict() without the cost of pydantic
+    content = {"item": [item.__dict__ for item in invoice.item],
+               "total": invoice.total,
+               "status": invoice.status,
+               "template": template_version}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def if_none_match(header: str, etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag
+    :param header: str, If-None-Match header
+    :param etag: str, quoted ETag
+    :return: bool, True if the client copy is up to date
+    """
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def parse_range(header: str, length: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header of a single range of bytes, raise ValueError if it can not be satisfied
+    :param header: str, Range header, e.g. bytes=0-1023, bytes=1024- or bytes=-512
+    :param length: int, size of the file
+    :return: first and last byte (included) or None to send the whole file
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        # Unknown unit or several ranges, the whole file is sent
+        return None
+    first, _, last = ranges.strip().partition("-")
+    try:
+        if not first:
+            start, end = max(0, length - int(last)), length - 1
+        else:
+            start, end = int(first), min(int(last), length - 1) if last else length - 1
+    except ValueError:
+        return None
+    if start > end or start >= length:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
 def define_price(item: InvoiceItem) -> InvoiceItem:
     price_level = {"1": 30, "2": 35, "3": 40}
     item.unit_price = price_level[item.projectLevel]
@@ -41,3 +240,29 @@ def generate_forfait(student_set: set) -> InvoiceItem:
     forfait.price = unique_student * forfait.unit_price
     forfait.count = unique_student
     return forfait
+
+
+async def build_invoice(date: str, groups: AsyncIterable[dict]) -> InvoiceOutModel:
+    """
+    Price the groups of sessions (projectLevel, type, status, student_status) as they arrive
+    and build the invoice of the month. No group is dropped, an unexpected number of groups is logged
+    :param date: str, month in format YYYY-MM
+    :param groups: groups from the billing rollup, students are the self-financed students names
+    :return: InvoiceOutModel
+    """
+    items, auto_student = [], set()
+    async for item in groups:
+        if len(items) == settings.INVOICE_MAX_GROUPS:
+            logger.warning("Invoice %s has more than %s groups of sessions", date, settings.INVOICE_MAX_GROUPS)
+        if item["student_status"] == "Auto-financé":
+            auto_student.update(item["students"])
+        items.append(define_price(InvoiceItem(**item)))
+
+    if auto_student:
+        items.append(generate_forfait(auto_student))
+
+    total = sum([item.price for item in items])
+    return InvoiceOutModel(**{"date": date,
+                              "id": "OC-" + date,
+                              "item": items,
+                              "total": total})
@@ -3,19 +3,33 @@ CRUD operation on DB for invoicing:
 - find_invoice_by_date
 - find_invoice_by_id
 - find_all_invoices
+- find_invoices_page
+- stream_all_invoices
 - create_invoice
+- create_invoices
 - delete_invoice
 - update_full_invoice
 - update_pdf_invoice
+- find_invoice_pdf
+- find_invoice_pdf_hash
+- stream_invoice_pdf
 - update_status_invoice
 - add_invoice
 """
-from typing import List
+import hashlib
+from typing import List, Tuple, Optional, AsyncIterator
+
+from bson import ObjectId
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridOut
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
 
 from app.core.config import settings
 from app.core.db import mongodb, MongoDB
-from app.core.utils import generate_forfait, define_price
-from app.schema.invoice import InvoiceItem, FileInvoice, InvoiceOutModel
+from app.core.utils import build_invoice, month_list, as_async, model_projection
+from app.crud.rollup import find_rollup, find_rollups
+from app.schema.invoice import FileInvoice, FileInvoiceRef, InvoiceOutModel, InvoiceBatchOutModel
 
 
 async def find_invoice_by_date(date: str, mongo: MongoDB = mongodb) -> InvoiceOutModel:
@@ -25,7 +39,7 @@ async def find_invoice_by_date(date: str, mongo: MongoDB = mongodb) -> InvoiceOu
     :param mongo: MongoDB
     :return: If invoice in DB return InvoiceModel else None
     """
-    if invoice := await mongo.invoice_coll.find_one({"date": date}):
+    if invoice := await mongo.invoice_coll.find_one({"date": date}, model_projection(InvoiceOutModel)):
         return InvoiceOutModel(**invoice)
     else:
         return InvoiceOutModel()
@@ -38,7 +52,7 @@ async def find_invoice_by_id(id: str, mongo: MongoDB = mongodb) -> InvoiceOutMod
     :param mongo: MongoDB
     :return: If invoice in DB return InvoiceModel else None
     """
-    if invoice := await mongo.invoice_coll.find_one({"id": id}):
+    if invoice := await mongo.invoice_coll.find_one({"id": id}, model_projection(InvoiceOutModel)):
         return InvoiceOutModel(**invoice)
     else:
         return InvoiceOutModel()
@@ -50,143 +64,106 @@ async def find_all_invoices(mongo: MongoDB = mongodb) -> List[InvoiceOutModel]:
     :param mongo:
     :return: Return a list of InvoiceModel else None
     """
-    cursor = mongo.invoice_coll.find()
-    invoices = []
-    for document in await cursor.to_list(length=100):
-        invoices.append(document)
+    invoices = [invoice async for invoice in stream_all_invoices(mongo)]
     if invoices:
-        return [InvoiceOutModel(**invoice) for invoice in invoices]
+        return invoices
     else:
         return [InvoiceOutModel()]
 
 
+async def find_invoices_page(after: Optional[ObjectId] = None, limit: int = settings.PAGE_SIZE,
+                             mongo: MongoDB = mongodb) -> Tuple[List[InvoiceOutModel], Optional[str]]:
+    """
+    Fetch a page of invoices from the DB
+    :param after: ObjectId, last invoice of the previous page
+    :param limit: int, size of the page
+    :param mongo: MongoDB
+    :return: list of InvoiceModel, cursor of the next page
+    """
+    invoices, cursor = await mongo.find_page(mongo.invoice_coll, {}, after, limit,
+                                               model_projection(InvoiceOutModel))
+    return [InvoiceOutModel(**invoice) for invoice in invoices], cursor
+
+
+async def stream_all_invoices(mongo: MongoDB = mongodb) -> AsyncIterator[InvoiceOutModel]:
+    """
+    Iterate over all invoices from the DB
+    :param mongo: MongoDB
+    :return: InvoiceModel
+    """
+    async for invoice in mongo.stream(mongo.invoice_coll, {}, model_projection(InvoiceOutModel)):
+        yield InvoiceOutModel(**invoice)
+
+
 async def create_invoice(date: str, mongo: MongoDB = mongodb) -> InvoiceOutModel:
     """
-    Make an aggregation on sessions to group sessions by date,type, status,...
+    Read the sessions grouped by date,type, status,... from the billing rollup
     then create the corresponding document
     :param date: str
     :param mongo: MongoDB
     :return: InvoiceModel
     """
-    cursor = mongo.session_coll.aggregate([
-        {
-            '$match': {
-                '$or': [
-                    {
-                        'status': {
-                            '$eq': 'completed'
-                        }
-                    }, {
-                        'status': {
-                            '$eq': 'marked student as absent'
-                        }
-                    }
-                ]
-            }
-        }, {
-            '$set': {
-                'yearmonth': {
-                    '$dateToString': {
-                        'date': '$sessionDate',
-                        'format': '%Y-%m'
-                    }
-                }
-            }
-        }, {
-            '$match': {
-                'yearmonth': {
-                    '$eq': date
-                }
-            }
-        }, {
-            '$lookup': {
-                'from': settings.MONGO_STUDENT_COLL,
-                'as': 'student',
-                'let': {
-                    'recipient_id': '$recipient'
-                },
-                'pipeline': [
-                    {
-                        '$match': {
-                            '$expr': {
-                                '$eq': [
-                                    '$id', '$$recipient_id'
-                                ]
-                            }
-                        }
-                    }, {
-                        '$project': {
-                            'status': 1,
-                            'displayName': 1
-                        }
-                    }
-                ]
-            }
-        }, {
-            '$unwind': {
-                'path': '$student'
-            }
-        }, {
-            '$group': {
-                '_id': {
-                    'yearmonth': '$yearmonth',
-                    'projectLevel': '$projectLevel',
-                    'type': '$type',
-                    'status': '$status',
-                    'student_status': '$student.status'
-                },
-                'students': {
-                    '$addToSet': '$student'
-                },
-                'count': {
-                    '$sum': 1
-                }
-            }
-        }, {
-            '$project': {
-                'yearmonth': '$_id.yearmonth',
-                'projectLevel': '$_id.projectLevel',
-                'type': '$_id.type',
-                'status': '$_id.status',
-                'student_status': '$_id.student_status',
-                'count': 1,
-                'students': 1
-            }
-        }, {
-            '$sort': {
-                'yearmonth': -1
-            }
-        }
-    ])
-    result = await cursor.to_list(10)
-    items, auto_student = [], []
-
-    for item in result:
-        if item["student_status"] == "Auto-financé":
-            auto_student += [student["displayName"] for student in item["students"]]
-        items.append(define_price(InvoiceItem(**item)))
-
-    if auto_student:
-        items.append(generate_forfait(auto_student))
-
-    total = sum([item.price for item in items])
-    invoice = InvoiceOutModel(**{"date": date,
-                                 "id": "OC-" + date,
-                                 "item": items,
-                                 "total": total})
+    invoice = await build_invoice(date, find_rollup(date, mongo))
     await mongo.invoice_coll.insert_one(invoice.dict())
     return invoice
 
 
+async def create_invoices(start: str, end: str, mongo: MongoDB = mongodb) -> InvoiceBatchOutModel:
+    """
+    Create the invoices of every month between start and end (included) not already in DB.
+    The months missing from the billing rollup are computed with one aggregation,
+    invoices are saved with one bulk insert
+    :param start: str, first month in format YYYY-MM
+    :param end: str, last month in format YYYY-MM
+    :param mongo: MongoDB
+    :return: InvoiceBatchOutModel, invoices created and months skipped
+    """
+    months = month_list(start, end)
+    skipped = await mongo.invoice_coll.distinct("date", {"date": {"$in": months}})
+    missing = [month for month in months if month not in skipped]
+    if not missing:
+        return InvoiceBatchOutModel(skipped=sorted(skipped))
+
+    groups = await find_rollups(missing, mongo)
+    invoices = [await build_invoice(month, as_async(groups[month])) for month in missing]
+    try:
+        await mongo.invoice_coll.insert_many([invoice.dict() for invoice in invoices], ordered=False)
+    except BulkWriteError as error:
+        # Invoices created meanwhile by another request
+        duplicated = {invoices[write_error["index"]].date for write_error in error.details["writeErrors"]
+                      if write_error["code"] == 11000}
+        if len(duplicated) != len(error.details["writeErrors"]):
+            raise
+        skipped += list(duplicated)
+        invoices = [invoice for invoice in invoices if invoice.date not in duplicated]
+    return InvoiceBatchOutModel(created=invoices, skipped=sorted(skipped))
+
+
 async def delete_invoice(id: str, mongo: MongoDB = mongodb) -> int:
     """
-    Delete an invoice in the DB with the corresponding id
+    Delete an invoice in the DB with the corresponding id, with its pdf
     :param id: str
     :param mongo: MongoDB
     :return: Number of invoice deleted
     """
-    invoice = await mongo.invoice_coll.delete_one({"id": id})
-    return invoice.deleted_count
+    if invoice := await mongo.invoice_coll.find_one_and_delete({"id": id}, {"file.file_id": 1}):
+        await delete_pdf(invoice, mongo)
+        return 1
+    return 0
+
+
+async def delete_pdf(invoice: dict, mongo: MongoDB = mongodb):
+    """
+    Delete the pdf of an invoice document from GridFS
+    :param invoice: dict, invoice document with at least file.file_id
+    :param mongo: MongoDB
+    :return:
+    """
+    if file_id := (invoice.get("file") or {}).get("file_id"):
+        try:
+            await mongo.pdf_bucket.delete(file_id)
+        except NoFile:
+            pass
 
 
 async def update_status_invoice(id: str, status: str, mongo: MongoDB = mongodb) -> InvoiceOutModel:
@@ -207,18 +184,89 @@ async def update_status_invoice(id: str, status: str, mongo: MongoDB = mongodb)
 
 async def update_pdf_invoice(id: str, file: FileInvoice, mongo: MongoDB = mongodb) -> InvoiceOutModel:
     """
-    Update the pdf of the invoice
+    Update the pdf of the invoice: the pdf is saved in GridFS and its reference on the invoice,
+    the hash of the file content is used if no hash is given
     :param id: str
-    :param file: bytes
+    :param file: FileInvoice
     :param mongo: MongoDB
     :return: InvoiceModel or None if the invoice is not DB
     """
-    if invoice := await find_invoice_by_id(id):
-        await mongo.invoice_coll.update_one({"id": invoice.id}, {'$set': {'file': file.dict()}})
-        invoice.filename = file.filename
-        return invoice
-    else:
+    if not await mongo.invoice_coll.count_documents({"id": id}, limit=1):
+        return InvoiceOutModel()
+    if file.hash is None:
+        file.hash = hashlib.sha256(file.file).hexdigest()
+    file_id = await mongo.pdf_bucket.upload_from_stream(file.filename, file.file,
+                                                        metadata={"invoice": id, "hash": file.hash})
+    ref = FileInvoiceRef(file_id=file_id, filename=file.filename, hash=file.hash, length=len(file.file))
+    previous = await mongo.invoice_coll.find_one_and_update({"id": id}, {'$set': {'file': ref.dict()}},
+                                                            {"file.file_id": 1},
+                                                            return_document=ReturnDocument.BEFORE)
+    if previous is None:
+        # Invoice deleted meanwhile
+        await mongo.pdf_bucket.delete(file_id)
         return InvoiceOutModel()
+    await delete_pdf(previous, mongo)
+    invoice = await find_invoice_by_id(id, mongo)
+    return invoice
+
+
+async def find_invoice_pdf(id: str, mongo: MongoDB = mongodb) -> Optional[FileInvoiceRef]:
+    """
+    Fetch the reference of the pdf of the invoice, a pdf still embedded in the invoice is moved to GridFS
+    :param id: str
+    :param mongo: MongoDB
+    :return: FileInvoiceRef or None if the invoice has no pdf
+    """
+    if invoice := await mongo.invoice_coll.find_one({"id": id, "file.file_id": {"$exists": True}}, {"file": 1}):
+        return FileInvoiceRef(**invoice["file"])
+    if invoice := await mongo.invoice_coll.find_one({"id": id, "file.file": {"$exists": True}}, {"file": 1}):
+        await update_pdf_invoice(id, FileInvoice(**invoice["file"]), mongo)
+        return await find_invoice_pdf(id, mongo)
+
+
+async def find_invoice_pdf_hash(id: str, mongo: MongoDB = mongodb) -> Optional[str]:
+    """
+    Fetch the hash of the pdf of the invoice, without the pdf
+    :param id: str
+    :param mongo: MongoDB
+    :return: str or None if the invoice has no pdf hash
+    """
+    if invoice := await mongo.invoice_coll.find_one({"id": id}, {"file.hash": 1}):
+        return (invoice.get("file") or {}).get("hash")
+
+
+async def open_invoice_pdf(file_id: ObjectId, mongo: MongoDB = mongodb) -> Optional[AsyncIOMotorGridOut]:
+    """
+    Open a pdf in GridFS, before its response is sent
+    :param file_id: ObjectId, file_id of the FileInvoiceRef
+    :param mongo: MongoDB
+    :return: AsyncIOMotorGridOut or None if the file is not in GridFS
+    """
+    try:
+        return await mongo.pdf_bucket.open_download_stream(file_id)
+    except NoFile:
+        return None
+
+
+async def stream_invoice_pdf(grid_out: AsyncIOMotorGridOut, start: int = 0,
+                             end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Read a pdf opened in GridFS chunk by chunk
+    :param grid_out: AsyncIOMotorGridOut, from open_invoice_pdf
+    :param start: int, first byte
+    :param end: int, last byte (included), None for the end of the file
+    :return: bytes, one GridFS chunk at most
+    """
+    if end is None:
+        end = grid_out.length - 1
+    grid_out.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = await grid_out.read(min(grid_out.chunk_size, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
 
 
 async def update_full_invoice(id: str) -> InvoiceOutModel:
@@ -0,0 +1,44 @@
+"""
+CRUD operation on DB for the background jobs:
+- find_job
+- save_job
+- interrupt_jobs
+"""
+from typing import Optional
+
+from app.core.db import MongoDB, mongodb
+from app.core.utils import model_projection
+from app.schema.jobs import JobModel, JobStatusEnum
+
+
+async def find_job(id: str, mongo: MongoDB = mongodb) -> Optional[JobModel]:
+    """
+    Fetch a job
+    :param id: str, job id
+    :param mongo: MongoDB
+    :return: JobModel or None if the job does not exist
+    """
+    if job := await mongo.job_coll.find_one({"id": id}, model_projection(JobModel)):
+        return JobModel(**job)
+
+
+async def save_job(job: JobModel, mongo: MongoDB = mongodb) -> JobModel:
+    """
+    Create or replace a job
+    :param job: JobModel
+    :param mongo: MongoDB
+    :return: JobModel
+    """
+    await mongo.job_coll.replace_one({"id": job.id}, job.dict(), upsert=True)
+    return job
+
+
+async def interrupt_jobs(mongo: MongoDB = mongodb) -> int:
+    """
+    Mark as interrupted the jobs which were still pending or running when the app stopped
+    :param mongo: MongoDB
+    :return: Number of jobs interrupted
+    """
+    jobs = await mongo.job_coll.update_many({"status": {"$in": [JobStatusEnum.pending, JobStatusEnum.running]}},
+                                            {"$set": {"status": JobStatusEnum.interrupted}})
+    return jobs.modified_count
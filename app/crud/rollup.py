@@ -0,0 +1,244 @@
+"""
+CRUD operation on DB for the monthly billing rollup,
+sessions grouped by (yearmonth, projectLevel, type, status, student_status):
+- invoice_pipeline
+- refresh_rollup
+- find_rollup
+- find_rollups
+- session_months
+- student_months
+"""
+import asyncio
+from contextlib import AsyncExitStack
+from datetime import datetime
+from typing import List, Iterable, AsyncIterator, Dict
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from app.core.db import mongodb, MongoDB
+from app.core.utils import month_range, to_naive_utc
+
+BILLABLE_STATUS = ['completed', 'marked student as absent']
+ROLLUP_KEY = ['yearmonth', 'projectLevel', 'type', 'status', 'student_status']
+
+# Refresh running for each month: two refreshes of a month would delete each other's groups
+rollup_locks: Dict[str, asyncio.Lock] = {}
+
+
+def invoice_pipeline(start: datetime, end: datetime, mongo: MongoDB = mongodb,
+                     months: List[str] = None) -> List[dict]:
+    """
+    Aggregation grouping the billable sessions between two dates
+    by yearmonth, projectLevel, type, status and student status.
+    Sessions are filtered on the date range first so the status_sessionDate index is used
+    :param start: datetime, included
+    :param end: datetime, excluded
+    :param mongo: MongoDB
+    :param months: list of months (YYYY-MM) to keep within the range, all if None
+    :return: pipeline
+    """
+    pipeline = [
+        {
+            '$match': {
+                'status': {
+                    '$in': BILLABLE_STATUS
+                },
+                'sessionDate': {
+                    '$gte': start,
+                    '$lt': end
+                }
+            }
+        }, {
+            '$set': {
+                'yearmonth': {
+                    '$dateToString': {
+                        'date': '$sessionDate',
+                        'format': '%Y-%m'
+                    }
+                }
+            }
+        }]
+    if months is not None:
+        pipeline.append({
+            '$match': {
+                'yearmonth': {
+                    '$in': months
+                }
+            }
+        })
+    return pipeline + [
+        {
+            '$lookup': {
+                'from': mongo.student_coll.name,
+                'as': 'student',
+                'let': {
+                    'recipient_id': '$recipient'
+                },
+                'pipeline': [
+                    {
+                        '$match': {
+                            '$expr': {
+                                '$eq': [
+                                    '$id', '$$recipient_id'
+                                ]
+                            }
+                        }
+                    }, {
+                        '$project': {
+                            'status': 1,
+                            'displayName': 1
+                        }
+                    }
+                ]
+            }
+        }, {
+            '$unwind': {
+                'path': '$student'
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    'yearmonth': '$yearmonth',
+                    'projectLevel': '$projectLevel',
+                    'type': '$type',
+                    'status': '$status',
+                    'student_status': '$student.status'
+                },
+                'students': {
+                    '$addToSet': '$student'
+                },
+                'count': {
+                    '$sum': 1
+                }
+            }
+        }, {
+            '$project': {
+                'yearmonth': '$_id.yearmonth',
+                'projectLevel': '$_id.projectLevel',
+                'type': '$_id.type',
+                'status': '$_id.status',
+                'student_status': '$_id.student_status',
+                'count': 1,
+                'students': 1
+            }
+        }]
+
+
+async def refresh_rollup(months: Iterable[str], mongo: MongoDB = mongodb) -> int:
+    """
+    Recompute the rollup of the months from the sessions, with one aggregation.
+    Groups are replaced in place so readers never see a month partially empty,
+    a month without billable session is stored as one empty group (count 0).
+    Refreshes sharing a month run one after the other
+    :param months: months in format YYYY-MM
+    :param mongo: MongoDB
+    :return: number of groups in the months
+    """
+    months = sorted(set(months))
+    if not months:
+        return 0
+    async with AsyncExitStack() as stack:
+        # Always locked in the same order, so two refreshes never wait for each other
+        for month in months:
+            await stack.enter_async_context(rollup_locks.setdefault(month, asyncio.Lock()))
+        return await _refresh_rollup(months, mongo)
+
+
+async def _refresh_rollup(months: List[str], mongo: MongoDB) -> int:
+    version = ObjectId()
+    cursor = mongo.session_coll.aggregate(invoice_pipeline(month_range(months[0])[0],
+                                                           month_range(months[-1])[1],
+                                                           mongo,
+                                                           months=months))
+    requests = []
+    empty = set(months)
+    async for group in cursor:
+        key = {field: group[field] for field in ROLLUP_KEY}
+        students = []
+        if group["student_status"] == "Auto-financé":
+            students = sorted({student["displayName"] for student in group["students"]})
+        requests.append(ReplaceOne(key, {**key, "count": group["count"], "students": students, "version": version},
+                                   upsert=True))
+        empty.discard(group["yearmonth"])
+    groups = len(requests)
+    # A month without billable session keeps an empty group, so it is not aggregated again on each read
+    for month in empty:
+        key = {**{field: None for field in ROLLUP_KEY}, "yearmonth": month}
+        requests.append(ReplaceOne(key, {**key, "count": 0, "students": [], "version": version}, upsert=True))
+    await mongo.rollup_coll.bulk_write(requests, ordered=False)
+    await mongo.rollup_coll.delete_many({"yearmonth": {"$in": months}, "version": {"$ne": version}})
+    return groups
+
+
+async def find_rollup(date: str, mongo: MongoDB = mongodb) -> AsyncIterator[dict]:
+    """
+    Groups of the month, the rollup of the month is computed if missing
+    :param date: str, month in format YYYY-MM
+    :param mongo: MongoDB
+    :return: groups (projectLevel, type, status, student_status, count, students)
+    """
+    if not await mongo.rollup_coll.find_one({"yearmonth": date}, {"_id": 1}):
+        await refresh_rollup([date], mongo)
+    async for group in mongo.rollup_coll.find({"yearmonth": date, "count": {"$gt": 0}}):
+        yield group
+
+
+async def find_rollups(months: List[str], mongo: MongoDB = mongodb) -> Dict[str, List[dict]]:
+    """
+    Groups of several months, the rollups missing are computed with one aggregation
+    :param months: months in format YYYY-MM
+    :param mongo: MongoDB
+    :return: dict, groups by month
+    """
+    present = await mongo.rollup_coll.distinct("yearmonth", {"yearmonth": {"$in": months}})
+    await refresh_rollup([month for month in months if month not in present], mongo)
+    groups = {month: [] for month in months}
+    async for group in mongo.rollup_coll.find({"yearmonth": {"$in": months}, "count": {"$gt": 0}}):
+        groups[group["yearmonth"]].append(group)
+    return groups
+
+
+def session_months(sessions: Iterable) -> List[str]:
+    """
+    Months of the sessions
+    :param sessions: sessions (SessionModel, SessionOutModel or dict from DB)
+    :return: months in format YYYY-MM
+    """
+    months = set()
+    for session in sessions:
+        date = session["sessionDate"] if isinstance(session, dict) else session.sessionDate
+        if isinstance(date, datetime):
+            months.add(to_naive_utc(date).strftime("%Y-%m"))
+    return sorted(months)
+
+
+async def student_months(ids: List[int], mongo: MongoDB = mongodb) -> List[str]:
+    """
+    Months with billable sessions of the students
+    :param ids: list of student id
+    :param mongo: MongoDB
+    :return: months in format YYYY-MM
+    """
+    cursor = mongo.session_coll.aggregate([
+        {
+            '$match': {
+                'recipient': {
+                    '$in': ids
+                },
+                'status': {
+                    '$in': BILLABLE_STATUS
+                }
+            }
+        }, {
+            '$group': {
+                '_id': {
+                    '$dateToString': {
+                        'date': '$sessionDate',
+                        'format': '%Y-%m'
+                    }
+                }
+            }
+        }
+    ])
+    return sorted([month["_id"] async for month in cursor])
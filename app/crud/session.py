@@ -1,13 +1,22 @@
 """
 CRUD operation on DB for interacting with sessions:
+- find_session_by_date
+- find_sessions_by_date
 - find_session_by_id
 - create_session
+- upsert_sessions
+- delete_session
+- delete_sessions
 """
 from datetime import datetime, timedelta
 from typing import List
 
+from pymongo import UpdateOne
+
 from app.core.db import MongoDB, mongodb
-from app.schema.sessions import SessionOutModel, SessionModel
+from app.core.utils import model_projection
+from app.crud.rollup import refresh_rollup, session_months
+from app.schema.sessions import SessionOutModel, SessionModel, SessionBulkOutModel
 
 
 async def find_session_by_date(date: datetime, duration: int, mongo: MongoDB = mongodb) -> SessionOutModel:
@@ -22,7 +31,7 @@ async def find_session_by_date(date: datetime, duration: int, mongo: MongoDB = m
     if session := await mongo.session_coll.find_one(
             {"sessionDate": {"$lte": date + timedelta(minutes=duration),
                              "$gte": date - timedelta(minutes=duration)},
-             "status": "pending"}):
+             "status": "pending"}, model_projection(SessionOutModel)):
         return SessionOutModel(**session)
 
 
@@ -35,12 +44,10 @@ async def find_sessions_by_date(date: datetime, mongo: MongoDB = mongodb) -> Lis
     """
     if cursor := mongo.session_coll.find(
             {"sessionDate": {"$gte": date},
-             "status": "pending"}):
-        sessions = []
-        for document in await cursor.to_list(length=100):
-            sessions.append(document)
+             "status": "pending"}, model_projection(SessionOutModel)):
+        sessions = [SessionOutModel(**session) async for session in cursor]
         if sessions:
-            return [SessionOutModel(**session) for session in sessions]
+            return sessions
         else:
             return [SessionOutModel()]
 
@@ -52,7 +59,7 @@ async def find_session_by_id(id: int, mongo: MongoDB = mongodb) -> SessionOutMod
     :param mongo: MongoDB
     :return: SessionOutModel
     """
-    if session := await mongo.session_coll.find_one({"id": id}):
+    if session := await mongo.session_coll.find_one({"id": id}, model_projection(SessionOutModel)):
         return SessionOutModel(**session)
     else:
         return SessionOutModel()
@@ -60,24 +67,75 @@ async def find_session_by_id(id: int, mongo: MongoDB = mongodb) -> SessionOutMod
 
 async def create_session(session: SessionModel, mongo: MongoDB = mongodb) -> SessionOutModel:
     """
-    Create a sessions from a SessionOutModel
+    Create a sessions from a SessionOutModel, then refresh the billing rollup of its month if it changed
     :param session: SessionOutModel
     :param mongo: MongoDB
     :return: SessionOutModel 
     """
-    if not await mongo.session_coll.find_one({"id": session.id}):
+    if not await mongo.session_coll.find_one({"id": session.id}, {"_id": 1}):
         await mongo.session_coll.insert_one(session.dict())
-    else:
-        await mongo.session_coll.update_one({"id": session.id}, {'$set': {'status': session.status}})
+        await refresh_rollup(session_months([session]), mongo)
+    elif (await mongo.session_coll.update_one({"id": session.id}, {'$set': {'status': session.status}})).modified_count:
+        await refresh_rollup(session_months([session]), mongo)
     return SessionOutModel(**session.dict())
 
 
+async def upsert_sessions(sessions: List[SessionModel], mongo: MongoDB = mongodb) -> SessionBulkOutModel:
+    """
+    Create or update a list of sessions with one unordered bulk write,
+    as create_session only the status of a session already in DB is updated.
+    Only the billing rollup of the months of the sessions new or with a new status is refreshed
+    :param sessions: List[SessionModel]
+    :param mongo: MongoDB
+    :return: SessionBulkOutModel, number of sessions inserted, modified and unchanged
+    """
+    sessions = list({session.id: session for session in sessions}.values())
+    if not sessions:
+        return SessionBulkOutModel()
+    known = {session["id"]: session["status"]
+             async for session in mongo.session_coll.find({"id": {"$in": [session.id for session in sessions]}},
+                                                          {"_id": 0, "id": 1, "status": 1})}
+    changed = [session for session in sessions if session.id not in known or known[session.id] != session.status]
+    requests = []
+    for session in sessions:
+        document = session.dict()
+        status = document.pop("status")
+        requests.append(UpdateOne({"id": session.id},
+                                  {'$set': {'status': status}, '$setOnInsert': document},
+                                  upsert=True))
+    result = await mongo.session_coll.bulk_write(requests, ordered=False)
+    if changed:
+        await refresh_rollup(session_months(changed), mongo)
+    return SessionBulkOutModel(inserted=result.upserted_count,
+                               modified=result.modified_count,
+                               unchanged=result.matched_count - result.modified_count)
+
+
 async def delete_session(id: int, mongo: MongoDB = mongodb) -> int:
     """
-    Delete a session in the DB with the corresponding id
+    Delete a session in the DB with the corresponding id, then refresh the billing rollup of its month
     :param id: str
     :param mongo: MongoDB
     :return: Number of session deleted
     """
-    session = await mongo.session_coll.delete_one({"id": id})
-    return session.deleted_count
+    if session := await mongo.session_coll.find_one_and_delete({"id": id}, {"_id": 0, "sessionDate": 1}):
+        await refresh_rollup(session_months([session]), mongo)
+        return 1
+    return 0
+
+
+async def delete_sessions(ids: List[int], mongo: MongoDB = mongodb) -> int:
+    """
+    Delete the sessions in the DB with the corresponding ids at once, then refresh the billing rollup of their months
+    :param ids: list of session id
+    :param mongo: MongoDB
+    :return: Number of sessions deleted
+    """
+    if not ids:
+        return 0
+    months = session_months([session async for session in mongo.session_coll.find({"id": {"$in": ids}},
+                                                                                   {"_id": 0, "sessionDate": 1})])
+    sessions = await mongo.session_coll.delete_many({"id": {"$in": ids}})
+    if sessions.deleted_count:
+        await refresh_rollup(months, mongo)
+    return sessions.deleted_count
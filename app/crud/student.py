@@ -1,34 +1,117 @@
 """
 CRUD operation on DB for interacting with sessions:
 - get_student_all_sessions
+- get_student_sessions_page
+- stream_student_sessions
 - create_student
+- create_students
+- update_student_profile
 - fetch_all_students
+- fetch_students_page
+- stream_all_students
 - find_student_with_id
 - find_student_with_email
 - get_distinct
+- find_unknown_students
+- find_students_to_refresh
 """
 
-from typing import List
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple, AsyncIterator
 
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from app.core.config import settings
 from app.core.db import mongodb, MongoDB
+from app.core.utils import model_projection
+from app.crud.rollup import refresh_rollup, student_months
 from app.schema.sessions import SessionOutModel
 from app.schema.users import UserModel, UserOutModel
 
 
 async def create_student(student: UserModel, mongo: MongoDB = mongodb) -> UserModel:
     """
-
+    Create a student, then refresh the billing rollup of the months of its sessions
     :param mongo:
     :param student: Student UserModel
     :return: UserModel
     """
-    if not await mongo.student_coll.find_one({"id": student.id}):
-        await mongo.student_coll.insert_one(student.dict())
+    if not await mongo.student_coll.find_one({"id": student.id}, {"_id": 1}):
+        await mongo.student_coll.insert_one({**student.dict(), "refreshed_at": datetime.utcnow()})
+        await refresh_rollup(await student_months([student.id], mongo), mongo)
         return student
     else:
         return UserModel()
 
 
+async def create_students(students: List[UserModel], mongo: MongoDB = mongodb) -> List[UserModel]:
+    """
+    Create the students not in DB yet in one insert, then refresh the billing rollup of the months of their sessions
+    :param students: list of Student UserModel
+    :param mongo: MongoDB
+    :return: list of UserModel created
+    """
+    unknown = await find_unknown_students([student.id for student in students], mongo) if students else []
+    students = [student for student in students if student.id in unknown]
+    if not students:
+        return []
+    try:
+        refreshed_at = datetime.utcnow()
+        await mongo.student_coll.insert_many([{**student.dict(), "refreshed_at": refreshed_at}
+                                              for student in students], ordered=False)
+    except BulkWriteError as error:
+        # Students created meanwhile by another sync
+        duplicated = {students[write_error["index"]].id for write_error in error.details["writeErrors"]
+                      if write_error["code"] == 11000}
+        if len(duplicated) != len(error.details["writeErrors"]):
+            raise
+        students = [student for student in students if student.id not in duplicated]
+    if students:
+        await refresh_rollup(await student_months([student.id for student in students], mongo), mongo)
+    return students
+
+
+async def update_student_profile(student: UserModel, mongo: MongoDB = mongodb) -> bool:
+    """
+    Replace the profile of a student fetched again from OC and stamp it as refreshed.
+    The billing rollup of the months of its sessions is refreshed if the status or the name changed
+    :param student: Student UserModel
+    :param mongo: MongoDB
+    :return: bool, True if the status or the name changed
+    """
+    previous = await mongo.student_coll.find_one_and_update({"id": student.id},
+                                                            {"$set": {**student.dict(),
+                                                                      "refreshed_at": datetime.utcnow()}},
+                                                            projection={"_id": 0, "status": 1, "displayName": 1},
+                                                            return_document=ReturnDocument.BEFORE)
+    if previous is None:
+        return False
+    if (previous.get("status"), previous.get("displayName")) == (student.status, student.displayName):
+        return False
+    await refresh_rollup(await student_months([student.id], mongo), mongo)
+    return True
+
+
+def student_sessions_query(id: int, include_status: str = "", exclude_status: str = "") -> dict:
+    """
+    Filter on the sessions of a student
+    :param id: id of the student (int)
+    :param include_status: str, session status separated by comma
+    :param exclude_status: str, session status separated by comma
+    :return: dict
+    """
+    exclude_status = exclude_status.split(",")
+    if include_status:
+        include_status = include_status.split(",")
+        return {"recipient": id,
+                '$and': [
+                    {"status": {'$in': include_status}},
+                    {"status": {'$nin': exclude_status}}]}
+    return {"recipient": id, "status": {'$nin': exclude_status}}
+
+
 async def get_student_all_sessions(id: int, include_status: str = "", exclude_status: str = "",
                                    mongo: MongoDB = mongodb) -> List[SessionOutModel]:
     """
@@ -39,23 +122,42 @@ async def get_student_all_sessions(id: int, include_status: str = "", exclude_st
     :param id: id of the student (int)
     :return: List of SessionOutputModel
     """
-    exclude_status = exclude_status.split(",")
-    if include_status:
-        include_status = include_status.split(",")
-        cursor = mongo.session_coll.find(
-            {"recipient": id,
-             '$and': [
-                 {"status": {'$in': include_status}},
-                 {"status": {'$nin': exclude_status}}]})
-    else:
-        cursor = mongo.session_coll.find({"recipient": id, "status": {'$nin': exclude_status}})
-    sessions = []
-    for document in await cursor.to_list(length=100):
-        sessions.append(SessionOutModel(**document))
-    if sessions:
-        return sessions
-    else:
-        return [SessionOutModel(**session) for session in sessions]
+    return [session async for session in stream_student_sessions(id, include_status, exclude_status, mongo)]
+
+
+async def get_student_sessions_page(id: int, include_status: str = "", exclude_status: str = "",
+                                    after: Optional[ObjectId] = None, limit: int = settings.PAGE_SIZE,
+                                    mongo: MongoDB = mongodb) -> Tuple[List[SessionOutModel], Optional[str]]:
+    """
+    Get a page of sessions from an student from DB
+    :param id: id of the student (int)
+    :param include_status: str, session status
+    :param exclude_status: str, session status
+    :param after: ObjectId, last session of the previous page
+    :param limit: int, size of the page
+    :param mongo: MongoDB
+    :return: List of SessionOutputModel, cursor of the next page
+    """
+    sessions, cursor = await mongo.find_page(mongo.session_coll,
+                                             student_sessions_query(id, include_status, exclude_status),
+                                             after, limit, model_projection(SessionOutModel))
+    return [SessionOutModel(**session) for session in sessions], cursor
+
+
+async def stream_student_sessions(id: int, include_status: str = "", exclude_status: str = "",
+                                  mongo: MongoDB = mongodb) -> AsyncIterator[SessionOutModel]:
+    """
+    Iterate over all sessions from an student from DB
+    :param id: id of the student (int)
+    :param include_status: str, session status
+    :param exclude_status: str, session status
+    :param mongo: MongoDB
+    :return: SessionOutputModel
+    """
+    async for session in mongo.stream(mongo.session_coll,
+                                      student_sessions_query(id, include_status, exclude_status),
+                                      model_projection(SessionOutModel)):
+        yield SessionOutModel(**session)
 
 
 async def fetch_all_students(mongo: MongoDB = mongodb) -> List[UserOutModel]:
@@ -64,14 +166,31 @@ async def fetch_all_students(mongo: MongoDB = mongodb) -> List[UserOutModel]:
     :param mongo: MongoDB
     :return: list of UserOutputModel
     """
-    cursor = mongo.student_coll.find()
-    students = []
-    for document in await cursor.to_list(length=100):
-        students.append(UserOutModel(**document))
-    if students:
-        return students
-    else:
-        return [UserOutModel(**student) for student in students]
+    return [student async for student in stream_all_students(mongo)]
+
+
+async def fetch_students_page(after: Optional[ObjectId] = None, limit: int = settings.PAGE_SIZE,
+                              mongo: MongoDB = mongodb) -> Tuple[List[UserOutModel], Optional[str]]:
+    """
+    Fetch a page of students from DB
+    :param after: ObjectId, last student of the previous page
+    :param limit: int, size of the page
+    :param mongo: MongoDB
+    :return: list of UserOutputModel, cursor of the next page
+    """
+    students, cursor = await mongo.find_page(mongo.student_coll, {}, after, limit,
+                                             model_projection(UserOutModel))
+    return [UserOutModel(**student) for student in students], cursor
+
+
+async def stream_all_students(mongo: MongoDB = mongodb) -> AsyncIterator[UserOutModel]:
+    """
+    Iterate over all students from DB
+    :param mongo: MongoDB
+    :return: UserOutputModel
+    """
+    async for student in mongo.stream(mongo.student_coll, {}, model_projection(UserOutModel)):
+        yield UserOutModel(**student)
 
 
 async def find_student_with_email(email: str, mongo: MongoDB = mongodb) -> UserOutModel:
@@ -81,7 +200,7 @@ async def find_student_with_email(email: str, mongo: MongoDB = mongodb) -> UserO
     :param mongo: MongoDB
     :return: UserOutputModel
     """
-    if student := await mongo.student_coll.find_one({"email": email}):
+    if student := await mongo.student_coll.find_one({"email": email}, model_projection(UserOutModel)):
         return UserOutModel(**student)
     else:
         return UserOutModel()
@@ -94,7 +213,7 @@ async def find_student_with_id(id: int, mongo: MongoDB = mongodb) -> UserOutMode
     :param mongo: MongoDB
     :return: UserOutputModel
     """
-    if student := await mongo.student_coll.find_one({"id": id}):
+    if student := await mongo.student_coll.find_one({"id": id}, model_projection(UserOutModel)):
         return UserOutModel(**student)
     else:
         return UserOutModel()
@@ -112,12 +231,69 @@ async def get_distinct(mongo: MongoDB = mongodb) -> List[int]:
         return []
 
 
+async def find_unknown_students(ids: List[int], mongo: MongoDB = mongodb) -> List[int]:
+    """
+    Find the students which are not in DB yet
+    :param ids: list of student id
+    :param mongo: MongoDB
+    :return: list of student id missing in DB
+    """
+    known = {student["id"] async for student in mongo.student_coll.find({"id": {"$in": ids}},
+                                                                        {"_id": 0, "id": 1})}
+    return [id for id in ids if id not in known]
+
+
+async def find_students_to_refresh(ttl: timedelta, mongo: MongoDB = mongodb) -> List[int]:
+    """
+    Find the students whose profile is older than the ttl or who had sessions since it was fetched,
+    future sessions are not taken into account
+    :param ttl: timedelta, maximum age of a profile
+    :param mongo: MongoDB
+    :return: list of student id, the oldest profiles first
+    """
+    now = datetime.utcnow()
+    expired = now - ttl
+    refreshed_at = {}
+    outdated = []
+    async for student in mongo.student_coll.find({}, {"_id": 0, "id": 1, "refreshed_at": 1}).sort("refreshed_at", 1):
+        if student.get("refreshed_at") is None or student["refreshed_at"] < expired:
+            outdated.append(student["id"])
+        else:
+            refreshed_at[student["id"]] = student["refreshed_at"]
+    if refreshed_at:
+        cursor = mongo.session_coll.aggregate([
+            {
+                '$match': {
+                    'recipient': {
+                        '$in': list(refreshed_at)
+                    },
+                    'sessionDate': {
+                        '$gte': min(refreshed_at.values()),
+                        '$lte': now
+                    }
+                }
+            }, {
+                '$group': {
+                    '_id': '$recipient',
+                    'last_session': {
+                        '$max': '$sessionDate'
+                    }
+                }
+            }])
+        async for student in cursor:
+            if student["last_session"] > refreshed_at[student["_id"]]:
+                outdated.append(student["_id"])
+    return outdated
+
+
 async def delete_student(id: int, mongo: MongoDB = mongodb) -> int:
     """
-    Delete a student in the DB with the corresponding id
+    Delete a student in the DB with the corresponding id, then refresh the billing rollup of the months of its sessions
     :param id: str
     :param mongo: MongoDB
     :return: Number of session deleted
     """
     session = await mongo.student_coll.delete_one({"id": id})
+    if session.deleted_count:
+        await refresh_rollup(await student_months([id], mongo), mongo)
     return session.deleted_count
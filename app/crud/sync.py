@@ -0,0 +1,44 @@
+"""
+CRUD operation on DB for the synchronisation state of a mentor:
+- find_sync_state
+- save_sync_state
+- delete_sync_state
+"""
+from app.core.db import MongoDB, mongodb
+from app.core.utils import model_projection
+from app.schema.sync import SyncStateModel
+
+
+async def find_sync_state(id: int, mongo: MongoDB = mongodb) -> SyncStateModel:
+    """
+    Fetch the synchronisation state of a mentor
+    :param id: int, mentor id
+    :param mongo: MongoDB
+    :return: SyncStateModel, empty state if the mentor never synced
+    """
+    if state := await mongo.sync_coll.find_one({"id": id}, model_projection(SyncStateModel)):
+        return SyncStateModel(**state)
+    else:
+        return SyncStateModel(id=id)
+
+
+async def save_sync_state(state: SyncStateModel, mongo: MongoDB = mongodb) -> SyncStateModel:
+    """
+    Create or replace the synchronisation state of a mentor
+    :param state: SyncStateModel
+    :param mongo: MongoDB
+    :return: SyncStateModel
+    """
+    await mongo.sync_coll.replace_one({"id": state.id}, state.dict(), upsert=True)
+    return state
+
+
+async def delete_sync_state(id: int, mongo: MongoDB = mongodb) -> int:
+    """
+    Delete the synchronisation state of a mentor
+    :param id: int, mentor id
+    :param mongo: MongoDB
+    :return: Number of state deleted
+    """
+    state = await mongo.sync_coll.delete_one({"id": id})
+    return state.deleted_count
@@ -1,11 +1,25 @@
+import asyncio
+import logging
 import time
 
+import httpx
 import uvicorn
 from fastapi import FastAPI, Request
+from starlette import status
+from starlette.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.routes import dependencies, invoice, session, student, utils
+from app.routes import dependencies, invoice, jobs, session, student, utils
+from app.routes.dependencies import NEXT_CURSOR_HEADER
+from app.core.breaker import CircuitOpenError
 from app.core.config import settings
+from app.core.credentials import credentials
+from app.core.db import mongodb
+from app.core.http import oc_client
+from app.services.html import invoice_template
+from app.services.jobs import job_runner
+from app.services.scheduler import sync_scheduler
+from app.services.sync import student_refresher
 
 app = FastAPI(title=settings.PROJECT_NAME)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -14,9 +28,48 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 app.include_router(student.router)
 app.include_router(session.router)
 app.include_router(invoice.router)
+app.include_router(jobs.router)
 app.include_router(dependencies.router)
 # app.include_router(utils.router)
 
+
+# STARTUP / SHUTDOWN
+@app.on_event("startup")
+async def startup():
+    await oc_client.start()
+    await mongodb.ensure_indexes()
+    await credentials.load()
+    await job_runner.start()
+    invoice_template.load()
+    for coll, report in (await mongodb.check_indexes()).items():
+        if report["missing"] or report["extra"]:
+            logging.warning("Indexes of %s, missing: %s, extra: %s", coll, report["missing"], report["extra"])
+    app.state.student_refresher = asyncio.create_task(student_refresher())
+    if settings.SYNC_SCHEDULER:
+        sync_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.student_refresher.cancel()
+    await job_runner.close()
+    await sync_scheduler.close()
+    await oc_client.close()
+
+
+@app.exception_handler(CircuitOpenError)
+async def circuit_open_handler(request: Request, error: CircuitOpenError):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": str(error)},
+                        headers={"Retry-After": str(int(error.retry_after) + 1)})
+
+
+@app.exception_handler(httpx.TransportError)
+async def oc_unreachable_handler(request: Request, error: httpx.TransportError):
+    return JSONResponse(status_code=status.HTTP_502_BAD_GATEWAY,
+                        content={"detail": "OC unreachable: " + repr(error)})
+
+
 # INCLUDES DEV DEPENDCIES
 if settings.DEV:
     @app.middleware("http")
@@ -35,6 +88,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET,POST,PUT,DELETE"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
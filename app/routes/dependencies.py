@@ -1,42 +1,72 @@
 """
 Dependencies module includes:
 - security oauth authentification on OC ressources
+- keyset pagination parameters
 """
-import requests
-from fastapi import Depends, HTTPException, APIRouter
+import hashlib
+import logging
+from typing import Optional
+
+import httpx
+from fastapi import Depends, HTTPException, APIRouter, Query
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from starlette import status
 
-from app.core.db import mongodb
+from app.core.breaker import CircuitOpenError
+from app.core.cache import token_cache, stale_token_cache
+from app.core.config import settings
+from app.core.credentials import credentials
+from app.core.http import oc_client
+from app.core.utils import decode_cursor
 from app.schema.authentification import Token, UserAuth
 from app.services.oc_api import login_oc
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 router = APIRouter(prefix="",
                    tags=["login"],
                    responses={404: {"description": "Not found"}})
 
 
-async def get_me(token: str = Depends(oauth2_scheme), cookie: str = Depends(mongodb.get_cookies)) -> UserAuth:
+async def get_me(token: str = Depends(oauth2_scheme)) -> UserAuth:
     """
-    Test the token from login on OC api
+    Test the token from login on OC api, tokens validated recently are not tested again.
+    When OC cannot be reached, a token validated in the last TOKEN_STALE_TTL seconds is accepted.
+    The session cookie of the mentor comes from the credential store
     :param token: token from oauth
-    :param cookie: session cookie
     :return: UserAuth
     """
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    if user := token_cache.get(token_hash):
+        return user
     headers = {'Authorization': 'Bearer ' + token}
-    req = requests.get('https://api.openclassrooms.com/me', headers=headers)
+    try:
+        req = await oc_client.get(settings.OC_API_URL + '/me', headers=headers)
+        unavailable = req.status_code >= 500 or req.status_code == 429
+    except (CircuitOpenError, httpx.TransportError) as error:
+        logging.warning("OC unavailable to validate a token: %r", error)
+        unavailable = True
+    if unavailable:
+        if user := stale_token_cache.get(token_hash):
+            return user
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="OC unavailable, could not validate credentials")
     if req.status_code != 200:
+        stale_token_cache.pop(token_hash)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return UserAuth(**{"username": req.json()["email"],
+    user = UserAuth(**{"username": req.json()["email"],
                        "token": token,
                        "id": req.json()["id"],
-                       "cookie": cookie})
+                       "cookie": credentials.get_cookie(req.json()["id"]) or ""})
+    token_cache.set(token_hash, user)
+    stale_token_cache.set(token_hash, user)
+    return user
 
 
 @router.post("/token", response_model=Token)
@@ -56,3 +86,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> dict:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
     return {"access_token": valid_auth["token"],
             "token_type": "bearer"}
+
+
+class Pagination:
+    def __init__(self, cursor: Optional[str] = None,
+                 limit: int = Query(settings.PAGE_SIZE, ge=1, le=settings.PAGE_SIZE_MAX)):
+        """
+        Keyset pagination parameters
+        :param cursor: cursor of the page, from the X-Next-Cursor header of the previous page
+        :param limit: number of items in the page
+        """
+        try:
+            self.after = decode_cursor(cursor) if cursor else None
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        self.limit = limit
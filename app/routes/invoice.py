@@ -4,6 +4,9 @@ API routes relating to the invoices:
     POST: add_new_invoice
     GET: get_all_invoice
 
+/export
+    GET: export_invoices
+
 /batch
     POST: create_batch_invoice
 
@@ -17,26 +20,33 @@ API routes relating to the invoices:
     PUT -> change_status_invoice
     PUT -> upload_pdf_invoice
 """
-import io
+import asyncio
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-import pdfkit
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, Query, Header
 from starlette import status
 from starlette.requests import Request
-from starlette.responses import StreamingResponse, HTMLResponse
-from starlette.templating import Jinja2Templates
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import StreamingResponse, HTMLResponse, Response, JSONResponse
 
-from app.crud.invoice import add_invoice, find_all_invoices, find_invoice_by_id, delete_invoice, update_full_invoice, \
-    update_status_invoice, update_pdf_invoice
-from app.schema.invoice import StatusEnum, FileInvoice, InvoiceOutModel
+from app.core.config import settings
+from app.core.utils import to_ndjson, invoice_content_hash, if_none_match, parse_range, month_list
+from app.crud.invoice import add_invoice, find_invoices_page, find_invoice_by_id, delete_invoice, \
+    update_full_invoice, update_status_invoice, update_pdf_invoice, stream_all_invoices, create_invoices, \
+    find_invoice_pdf, find_invoice_pdf_hash, open_invoice_pdf, stream_invoice_pdf
+from app.routes.dependencies import Pagination, NEXT_CURSOR_HEADER
+from app.schema.invoice import StatusEnum, FileInvoice, InvoiceOutModel, InvoiceBatchOutModel
+from app.schema.jobs import JobModel
+from app.services.html import invoice_template
+from app.services.jobs import job_runner
+from app.services.pdf import pdf_renderer, RenderQueueFullError
 
 router = APIRouter(prefix="/invoices",
                    tags=["invoices"],
                    responses={404: {"description": "Not found"}},
                    )
-templates = Jinja2Templates(directory="app/templates")
+MONTH_REGEX = r"^[0-9]{4}-(0[1-9]|1[0-2])$"
 
 
 @router.post("/",
@@ -60,25 +70,40 @@ async def add_new_invoice(year: str, month: str) -> InvoiceOutModel:
 
 
 @router.post("/batch",
-             response_model=List[InvoiceOutModel],
-             response_description="Invoice Created",
-             status_code=status.HTTP_201_CREATED)
-async def create_batch_invoices() -> List[InvoiceOutModel]:
+             response_model=InvoiceBatchOutModel,
+             response_description="Invoices Created",
+             status_code=status.HTTP_201_CREATED,
+             responses={202: {"model": JobModel, "description": "Invoices creation started"}})
+async def create_batch_invoices(start: str = Query(..., regex=MONTH_REGEX),
+                                end: str = Query(..., regex=MONTH_REGEX),
+                                background: bool = False) -> InvoiceBatchOutModel:
     """
-    Post a new Invoice (created from year and month param)
+    Post the invoices of every month between start and end, months already invoiced are skipped.
+    At most INVOICE_BATCH_MAX_MONTHS months at once
+    - **start**: string representing the first month in format YYYY-MM
+    - **end** : string representing the last month (included) in format YYYY-MM
+    - **background**: return a job at once instead of waiting for the invoices, see /jobs/{id}
     \f
-    :return:
+    :param start: str
+    :param end: str
+    :param background: bool
+    :return: InvoiceBatchOutModel
     """
-    invoices = []
-    for i in range(1, 13):
-        if i < 10:
-            month = "0" + str(i)
-        else:
-            month = str(i)
-        invoice = await add_invoice("2021" + "-" + month)
-        if invoice:
-            invoices.append(invoice)
-    if invoices[0].id:
+    if start > end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="start is after end")
+    if len(month_list(start, end)) > settings.INVOICE_BATCH_MAX_MONTHS:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="At most {} months at once".format(settings.INVOICE_BATCH_MAX_MONTHS))
+    if background:
+        async def batch(progress):
+            invoices = await create_invoices(start, end)
+            progress.add("invoices_created", len(invoices.created))
+            return invoices
+
+        job = await job_runner.submit("create_invoices", batch)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(job))
+    invoices = await create_invoices(start, end)
+    if invoices.created:
         return invoices
     raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Invoice already exist")
 
@@ -87,18 +112,36 @@ async def create_batch_invoices() -> List[InvoiceOutModel]:
             response_model=List[InvoiceOutModel],
             response_description="Invoices list",
             status_code=status.HTTP_200_OK)
-async def get_all_invoice() -> List[InvoiceOutModel]:
+async def get_all_invoice(response: Response, page: Pagination = Depends()) -> List[InvoiceOutModel]:
     """
-    Get all invoices from DB
+    Get all invoices from DB, page by page
+    - **cursor**: cursor of the page, given by the X-Next-Cursor header of the previous page
+    - **limit**: number of invoices in the page
     \f
+    :param response: Response
+    :param page: Pagination
     :return: list of InvoiceModel
     """
-    invoices = await find_all_invoices()
-    if invoices[0].id:
+    invoices, cursor = await find_invoices_page(page.after, page.limit)
+    if invoices:
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
         return invoices
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
 
 
+@router.get("/export",
+            response_description="Invoices stream (NDJSON)",
+            status_code=status.HTTP_200_OK)
+async def export_invoices() -> StreamingResponse:
+    """
+    Export all invoices from DB, one json per line
+    \f
+    :return: StreamingResponse
+    """
+    return StreamingResponse(to_ndjson(stream_all_invoices()), media_type="application/x-ndjson")
+
+
 @router.get("/{id}",
             response_model=InvoiceOutModel,
             response_description="Invoice found",
@@ -128,8 +171,7 @@ async def remove_invoice(id: str) -> str:
     :param id: str
     :return: InvoiceModel
     """
-    invoice = await delete_invoice(id)
-    if invoice.id:
+    if await delete_invoice(id):
         return "Invoice " + id + " deleted"
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
 
@@ -195,63 +237,119 @@ async def upload_pdf_invoice(id: str, pdf: UploadFile = File(...)) -> InvoiceOut
 
 
 @router.get("/{id}/pdf",
-            response_model=InvoiceOutModel,
             response_description="PDF fetched",
-            status_code=status.HTTP_201_CREATED)
-async def get_pdf_invoice(id: str) -> StreamingResponse:
+            status_code=status.HTTP_200_OK,
+            responses={206: {"description": "Part of the PDF fetched"},
+                       304: {"description": "PDF not modified"},
+                       416: {"description": "Range not satisfiable"}})
+async def get_pdf_invoice(id: str,
+                          if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+                          range_header: Optional[str] = Header(None, alias="Range"),
+                          if_range_header: Optional[str] = Header(None, alias="If-Range")) -> StreamingResponse:
     """
-    Get a pdf from the invoice
+    Get a pdf from the invoice, streamed chunk by chunk
     - **id**: string representing the invoice id.
+    - **If-None-Match**: ETag of the pdf already downloaded, 304 if it is still the same
+    - **Range**: single range of bytes to download, e.g. bytes=0-1023
+    - **If-Range**: ETag of the pdf partly downloaded, the whole pdf is sent if it changed
     \f
+    :param id: str
+    :param if_none_match_header: str
+    :param range_header: str
+    :param if_range_header: str
     :return: bytes
     """
-    invoice = await find_invoice_by_id(id)
-    if invoice.id:
-        file = io.BytesIO(invoice.file.file)
-        file.seek(0)
+    if if_none_match_header and (pdf_hash := await find_invoice_pdf_hash(id)):
+        etag = '"{}"'.format(pdf_hash)
+        if if_none_match(if_none_match_header, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    if pdf := await find_invoice_pdf(id):
+        # Opened before the response starts, a missing file can still be a 404
+        if (grid_out := await open_invoice_pdf(pdf.file_id)) is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice pdf not found")
         headers = {
-            'Content-Disposition': 'attachment; filename="{}"'.format(invoice.file.filename)
+            'Content-Disposition': 'attachment; filename="{}"'.format(pdf.filename),
+            'Accept-Ranges': 'bytes'
         }
-        return StreamingResponse(file, headers=headers)
+        etag = None
+        if pdf.hash:
+            etag = headers["ETag"] = '"{}"'.format(pdf.hash)
+        byte_range = None
+        if range_header and (not if_range_header or if_range_header == etag):
+            try:
+                byte_range = parse_range(range_header, pdf.length)
+            except ValueError:
+                raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                    detail="Range not satisfiable",
+                                    headers={"Content-Range": "bytes */{}".format(pdf.length)})
+        if byte_range is None:
+            headers["Content-Length"] = str(pdf.length)
+            return StreamingResponse(stream_invoice_pdf(grid_out), headers=headers, media_type="application/pdf")
+        start, end = byte_range
+        headers["Content-Range"] = "bytes {}-{}/{}".format(start, end, pdf.length)
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(stream_invoice_pdf(grid_out, start, end), headers=headers,
+                                 status_code=status.HTTP_206_PARTIAL_CONTENT, media_type="application/pdf")
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
 
 
-@router.get("/{id}/html")
-async def get_html_invoice(id: str, request: Request) -> HTMLResponse:
+@router.get("/{id}/html",
+            response_class=HTMLResponse,
+            responses={304: {"description": "HTML not modified"}})
+async def get_html_invoice(id: str, request: Request,
+                           if_none_match_header: Optional[str] = Header(None, alias="If-None-Match")) -> HTMLResponse:
     """
     Get html format of the invoice
     - **id**: string representing the invoice id.
+    - **If-None-Match**: ETag of the html already downloaded, 304 if it is still the same
     \f
+    :param id: str
+    :param request: Request
+    :param if_none_match_header: str
     :return: HTMLResponse
     """
     invoice = await find_invoice_by_id(id)
     if invoice.id:
-        return HTMLResponse(templates.TemplateResponse("invoice.html",
-                                          {"request": request, "invoice": invoice.dict(),
-                                           "date": datetime.today().date().strftime('%d/%m/%Y')}))
+        date = datetime.today().date().strftime('%d/%m/%Y')
+        if if_none_match_header:
+            etag = invoice_template.etag(invoice, date)
+            if if_none_match(if_none_match_header, etag):
+                return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        html, etag = invoice_template.render(invoice, date, request)
+        return HTMLResponse(html, headers={"ETag": etag})
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
 
 
 @router.put("/{id}/html/pdf")
-async def create_pdf_invoice(id: str, request: Request) -> StreamingResponse:
+async def create_pdf_invoice(id: str, request: Request) -> Response:
     """
-    Get pdf format of the invoice from html
+    Get pdf format of the invoice from html, the PDF is only rendered again
+    if the items, total, status or template of the invoice changed
     - **id**: string representing the invoice id.
     \f
     :return: Filereponse
     """
     invoice = await find_invoice_by_id(id)
     if invoice.id:
-        html = templates.TemplateResponse("invoice.html",
-                                          {"request": request, "invoice": InvoiceOutModel(**invoice).dict(),
-                                           "date": datetime.today().date().strftime('%d/%m/%Y')}).body
-
-        file_b = pdfkit.from_string(html.decode("utf8"), output_path=False)
-        file = io.BytesIO(file_b)
-        file.seek(0)
+        content_hash = invoice_content_hash(invoice, invoice_template.version)
         headers = {
-            'Content-Disposition': 'attachment; filename="{}.pdf"'.format(invoice["id"])
+            'Content-Disposition': 'attachment; filename="{}.pdf"'.format(invoice.id),
+            'ETag': '"{}"'.format(content_hash)
         }
-        await update_pdf_invoice(id, FileInvoice(**{"filename": invoice["id"] + ".pdf", "file": file_b}))
-        return StreamingResponse(file, headers=headers)
+        if await find_invoice_pdf_hash(id) == content_hash and (pdf := await find_invoice_pdf(id)) \
+                and (grid_out := await open_invoice_pdf(pdf.file_id)):
+            headers["Content-Length"] = str(pdf.length)
+            return StreamingResponse(stream_invoice_pdf(grid_out), headers=headers, media_type="application/pdf")
+        html, _ = invoice_template.render(invoice, datetime.today().date().strftime('%d/%m/%Y'), request)
+        try:
+            file_b = await pdf_renderer.render(html)
+        except RenderQueueFullError as error:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(error),
+                                headers={"Retry-After": str(int(error.retry_after))})
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="PDF rendering timed out")
+        await update_pdf_invoice(id, FileInvoice(**{"filename": invoice.id + ".pdf",
+                                                    "file": file_b,
+                                                    "hash": content_hash}))
+        return Response(file_b, headers=headers, media_type="application/pdf")
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Invoice not found")
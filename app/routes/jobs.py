@@ -0,0 +1,69 @@
+"""
+API routes relating to the background jobs:
+/scheduler
+    GET -> get_scheduler
+
+/{id}
+    GET -> get_job
+    DELETE -> cancel_job
+"""
+from fastapi import APIRouter, HTTPException
+from starlette import status
+
+from app.schema.jobs import JobModel
+from app.schema.sync import SchedulerMetricsModel
+from app.services.jobs import job_runner
+from app.services.scheduler import sync_scheduler
+
+router = APIRouter(prefix="/jobs",
+                   tags=["jobs"],
+                   responses={404: {"description": "Not found"}})
+
+
+@router.get("/scheduler",
+            response_model=SchedulerMetricsModel,
+            response_description="Metrics of the scheduled synchronisation",
+            status_code=status.HTTP_200_OK)
+async def get_scheduler() -> SchedulerMetricsModel:
+    """
+    Get the metrics of the last scheduled synchronisation of the sessions
+    \f
+    :return: SchedulerMetricsModel
+    """
+    return sync_scheduler.metrics
+
+
+@router.get("/{id}",
+            response_model=JobModel,
+            response_description="Job found",
+            status_code=status.HTTP_200_OK)
+async def get_job(id: str) -> JobModel:
+    """
+    Get the state and the progress of a job:
+    - **id**: string representing the job id.
+    \f
+    :param id: str
+    :return: JobModel
+    """
+    if job := await job_runner.get(id):
+        return job
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+
+
+@router.delete("/{id}",
+               response_model=JobModel,
+               response_description="Job cancelled",
+               status_code=status.HTTP_200_OK)
+async def cancel_job(id: str) -> JobModel:
+    """
+    Cancel a running job, the work already done is kept:
+    - **id**: string representing the job id.
+    \f
+    :param id: str
+    :return: JobModel
+    """
+    if job := await job_runner.cancel(id):
+        return job
+    if await job_runner.get(id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Job not running")
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
@@ -15,19 +15,19 @@ API routes relating to the invoices:
 from datetime import datetime
 from typing import List, Union
 
-import pydantic
 from fastapi import APIRouter, status, HTTPException, Depends
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
 
-from app.core.utils import get_range
-from app.crud.session import find_session_by_id, create_session, delete_session, \
-    find_sessions_by_date
-from app.crud.student import get_distinct, find_student_with_id, create_student
+from app.crud.session import find_session_by_id, delete_session, find_sessions_by_date
 from app.routes.dependencies import get_me
 from app.schema.authentification import UserAuth
-from app.schema.sessions import SessionModel, SessionScheduleInModel, SessionOutModel
-from app.schema.users import UserModel
-from app.services.oc_api import update_session_api, get_student_type, delete_session_oc
-from app.services.utils import schedule_session_wrapper
+from app.schema.jobs import JobModel
+from app.schema.sessions import SessionModel, SessionScheduleInModel, SessionOutModel, SessionCancelOutModel
+from app.services.jobs import job_runner
+from app.services.oc_api import delete_session_oc
+from app.services.sync import sync_sessions
+from app.services.utils import schedule_session_wrapper, cancel_sessions
 
 router = APIRouter(prefix="/session",
                    tags=["session"],
@@ -106,34 +106,37 @@ async def remove_session(id: int,
     :return:
     """
     if session := await delete_session(id):
-        delete_session_oc(id, user.cookie)
+        await delete_session_oc(id, user.cookie)
     else:
         print("session not in db")
-        delete_session_oc(id, user.cookie)
+        await delete_session_oc(id, user.cookie)
     return {"Session " + str(id) + " deleted"}
 
 
 @router.delete("/",
-               response_model=List[SessionOutModel],
+               response_model=SessionCancelOutModel,
                response_description="Sessions Deleted",
-               status_code=status.HTTP_200_OK)
+               status_code=status.HTTP_200_OK,
+               responses={202: {"model": JobModel, "description": "Cancellation started"}})
 async def remove_sessions(sessionDate: datetime,
+                          background: bool = False,
                           user: UserAuth = Depends(get_me)):
     """
     Remove sessions from DB and OC after requested date:
     - **sessionDate** : date with ISO format
+    - **background**: return a job at once instead of waiting for the cancellation, see /jobs/{id}
     \f
     :param sessionDate: date in format Y-m-dTHH:MM:SSZ
+    :param background: bool
     :param user: Request
-    :return: List[SessionOutModel]
+    :return: SessionCancelOutModel
     """
     if sessions := await find_sessions_by_date(sessionDate):
-        deleted = []
-        for session in sessions:
-            if delete_session_oc(session.id, user.cookie):
-                await delete_session(session.id)
-                deleted.append(session)
-        return deleted
+        if background:
+            job = await job_runner.submit("cancel_sessions",
+                                          lambda progress: cancel_sessions(sessions, user.cookie, progress=progress))
+            return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(job))
+        return await cancel_sessions(sessions, user.cookie)
     else:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No session found")
 
@@ -141,40 +144,24 @@ async def remove_sessions(sessionDate: datetime,
 @router.put("/update_sessions",
             response_model=List[SessionModel],
             response_description="Sessions fetched",
-            status_code=status.HTTP_201_CREATED)
-async def fetch_sessions(user: UserAuth = Depends(get_me)) -> List[SessionModel]:
+            status_code=status.HTTP_201_CREATED,
+            responses={202: {"model": JobModel, "description": "Synchronisation started"}})
+async def fetch_sessions(full: bool = False, background: bool = False,
+                         user: UserAuth = Depends(get_me)) -> List[SessionModel]:
     """
     Fetch session from OC
+    - **full**: fetch the whole history instead of the sessions changed since the last fetch
+    - **background**: return a job at once instead of waiting for the synchronisation, see /jobs/{id}
     \f
+    :param full: bool
+    :param background: bool
     :param user: Request
     :return: List[SessionModel]
     """
-    authorization_header = user.token
-    sessions, items_range = update_session_api(user_id=user.id,
-                                               range_min=0,
-                                               range_max=19,
-                                               return_range=True,
-                                               authorization=authorization_header)
-    if not sessions:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Issue when fetching")
-    for range_ in get_range(0, items_range)[1:-1]:
-        sessions += update_session_api(user_id=user.id,
-                                       range_min=range_["range_min"],
-                                       range_max=range_["range_max"],
-                                       authorization=authorization_header)
-    result = []
-    for session in sessions:
-        del session["expert"]
-        session["recipient"] = session["recipient"]["id"]
-        try:
-            if await create_session(SessionModel(**session)):
-                result.append(SessionModel(**session))
-        except pydantic.error_wrappers.ValidationError:
-            pass
-    if students_id := await get_distinct():
-        for student_id in students_id:
-            student = await find_student_with_id(student_id)
-            if not student.id:
-                student = UserModel(**get_student_type(student_id, authorization_header, user.cookie))
-                await create_student(student)
-    return result
+    if background:
+        async def sync(progress):
+            return {"sessions": len(await sync_sessions(user, full=full, progress=progress))}
+
+        job = await job_runner.submit("sync_sessions", sync)
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(job))
+    return await sync_sessions(user, full=full)
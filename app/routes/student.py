@@ -5,6 +5,9 @@ API routes relating to the invoices:
     POST: add_new_student
     GET: get_all_students,
 
+/export
+    GET: export_students
+
 /update_session
     PUT -> fetch_sessions
 /{email}
@@ -13,6 +16,8 @@ API routes relating to the invoices:
     GET -> get_student_by_id
 /{id}/sessions
     GET -> get_student_sessions
+/{id}/sessions/export
+    GET -> export_student_sessions
 /{id}/schedule
     POST -> schedule
 """
@@ -20,11 +25,13 @@ from datetime import datetime
 from typing import List
 
 from fastapi import APIRouter, status, HTTPException, Depends
+from starlette.responses import Response, StreamingResponse
 
+from app.core.utils import to_ndjson
 from app.crud.session import find_session_by_date, create_session
-from app.crud.student import fetch_all_students, create_student, find_student_with_id, get_student_all_sessions, \
-    find_student_with_email
-from app.routes.dependencies import get_me
+from app.crud.student import fetch_students_page, create_student, find_student_with_id, get_student_sessions_page, \
+    find_student_with_email, stream_all_students, stream_student_sessions
+from app.routes.dependencies import get_me, Pagination, NEXT_CURSOR_HEADER
 from app.schema.authentification import UserAuth
 from app.schema.sessions import SessionOutModel, SessionScheduleInModel, SessionScheduleRequestModel, SessionModel
 from app.schema.users import UserOutModel, UserModel
@@ -39,17 +46,36 @@ router = APIRouter(prefix="/students",
             response_model=List[UserOutModel],
             response_description="Students list",
             status_code=status.HTTP_200_OK)
-async def get_all_students() -> List[UserOutModel]:
+async def get_all_students(response: Response, page: Pagination = Depends()) -> List[UserOutModel]:
     """
-    Get all students from db
+    Get all students from db, page by page
+    - **cursor**: cursor of the page, given by the X-Next-Cursor header of the previous page
+    - **limit**: number of students in the page
     \f
+    :param response: Response
+    :param page: Pagination
     :return: List[UserOutputModel]
     """
-    if students := await fetch_all_students():
+    students, cursor = await fetch_students_page(page.after, page.limit)
+    if students:
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
         return students
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No students")
 
 
+@router.get("/export",
+            response_description="Students stream (NDJSON)",
+            status_code=status.HTTP_200_OK)
+async def export_students() -> StreamingResponse:
+    """
+    Export all students from db, one json per line
+    \f
+    :return: StreamingResponse
+    """
+    return StreamingResponse(to_ndjson(stream_all_students()), media_type="application/x-ndjson")
+
+
 @router.post("/",
              response_model=UserModel,
              response_description="Student added",
@@ -122,24 +148,52 @@ async def get_student_by_id(id: int) -> UserOutModel:
             response_model=List[SessionOutModel],
             response_description="Session List from student",
             status_code=status.HTTP_200_OK)
-async def get_student_sessions(id: int, include_status: str = "", exclude_status: str = "") -> List[SessionOutModel]:
+async def get_student_sessions(response: Response, id: int, include_status: str = "", exclude_status: str = "",
+                               page: Pagination = Depends()) -> List[SessionOutModel]:
     """
-    Get all sessions from the student according to its id:
+    Get all sessions from the student according to its id, page by page:
     - **id** : integer representing the student id.
     - **include_status** : filter by status (session)
     - **exclude_status**: status to be excluded
+    - **cursor**: cursor of the page, given by the X-Next-Cursor header of the previous page
+    - **limit**: number of sessions in the page
     \f
+    :param response: Response
     :param exclude_status: str
     :param include_status: str
     :param id: int
+    :param page: Pagination
     :return: List[SessionOutputModel]
     """
-    sessions = await get_student_all_sessions(id=id, include_status=include_status, exclude_status=exclude_status)
+    sessions, cursor = await get_student_sessions_page(id=id, include_status=include_status,
+                                                       exclude_status=exclude_status,
+                                                       after=page.after, limit=page.limit)
     if sessions:
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
         return sessions
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Sessions not found")
 
 
+@router.get("/{id}/sessions/export",
+            response_description="Session stream from student (NDJSON)",
+            status_code=status.HTTP_200_OK)
+async def export_student_sessions(id: int, include_status: str = "", exclude_status: str = "") -> StreamingResponse:
+    """
+    Export all sessions from the student according to its id, one json per line:
+    - **id** : integer representing the student id.
+    - **include_status** : filter by status (session)
+    - **exclude_status**: status to be excluded
+    \f
+    :param exclude_status: str
+    :param include_status: str
+    :param id: int
+    :return: StreamingResponse
+    """
+    return StreamingResponse(to_ndjson(stream_student_sessions(id, include_status, exclude_status)),
+                             media_type="application/x-ndjson")
+
+
 @router.post("/{id}/schedule",
              response_model=UserModel,
              response_description="Schedule a meeting with the student",
@@ -163,12 +217,12 @@ async def schedule_meeting_with_student(id: int, sessionDate: datetime, user: Us
     new_session = SessionScheduleRequestModel(**{"studentId": schedule.studentId,
                                                  "mentorId": user.id,
                                                  "sessionDate": schedule.sessionDate})
-    session_saved = schedule_meeting(new_session, user.cookie)
+    session_saved = await schedule_meeting(new_session, user.cookie)
     if session_saved is not None:
         if session_saved.status_code != 201:
             raise HTTPException(status_code=session_saved.status_code, detail=session_saved.json())
         # find session in OC
-        session = find_specific_session(user.id, user.token, "pending", after=schedule.sessionDate)
+        session = await find_specific_session(user.id, user.token, "pending", after=schedule.sessionDate)
         if session:
             session = session[0]
             del session["expert"]
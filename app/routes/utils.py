@@ -9,7 +9,7 @@ API routes relating to utilities:
 from fastapi import HTTPException, APIRouter
 from starlette import status
 
-from app.core.db import mongodb
+from app.core.credentials import credentials
 from app.crud.student import find_student_with_email
 from app.routes.dependencies import get_me
 from app.schema.sessions import SessionOutModel
@@ -36,7 +36,10 @@ async def post_session_event(event: dict) -> SessionOutModel:
                                "start": event["payload"]["event"]["start_time"],
                                "name": event["payload"]["invitee"]["name"],
                                "email": event["payload"]["invitee"]["email"]})
-    user = await get_me(mongodb.get_token(), cookie="")
+    if not (token := credentials.get_token()):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="No mentor logged in, log in first")
+    user = await get_me(token)
     if student := await find_student_with_email(event.email):
         session = await schedule_session_wrapper(student["id"], user, event.start)
         return session
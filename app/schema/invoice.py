@@ -1,7 +1,7 @@
 """
 Schema for invoice
 """
-from typing import List, Optional
+from typing import Any, List, Optional
 
 from pydantic import BaseModel
 from pydantic.types import Enum
@@ -31,6 +31,14 @@ class InvoiceItem(BaseModel):
 class FileInvoice(BaseModel):
     file: bytes = None
     filename: str = None
+    hash: Optional[str] = None
+
+
+class FileInvoiceRef(BaseModel):
+    file_id: Any = None
+    filename: str = None
+    hash: Optional[str] = None
+    length: int = 0
 
 
 class FileInvoiceOut(BaseModel):
@@ -53,3 +61,8 @@ class InvoiceOutModel(BaseModel):
     total: Optional[float] = 0
     item: List[InvoiceItem] = []
     file: Optional[FileInvoiceOut] = None
+
+
+class InvoiceBatchOutModel(BaseModel):
+    created: List[InvoiceOutModel] = []
+    skipped: List[str] = []
@@ -0,0 +1,29 @@
+"""
+Schema for the background jobs
+"""
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+
+class JobStatusEnum(str, Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+    interrupted = "interrupted"
+
+
+class JobModel(BaseModel):
+    id: str
+    kind: str
+    status: JobStatusEnum = JobStatusEnum.pending
+    progress: Dict[str, int] = {}
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
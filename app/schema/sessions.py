@@ -2,7 +2,7 @@
 Schema for session
 """
 from datetime import datetime
-from typing import Union, Optional
+from typing import Union, Optional, List
 
 from pydantic import BaseModel
 from app.schema.users import UserInModel
@@ -56,3 +56,19 @@ class SessionInputModel(SessionOutModel):
 class SessionModel(SessionOutModel):
     lifeCycleStatus: str = ""
     videoConference: Union[None, str] = ""
+
+
+class SessionBulkOutModel(BaseModel):
+    inserted: int = 0
+    modified: int = 0
+    unchanged: int = 0
+
+
+class SessionCancelFailureModel(BaseModel):
+    id: int
+    reason: str
+
+
+class SessionCancelOutModel(BaseModel):
+    succeeded: List[SessionOutModel] = []
+    failed: List[SessionCancelFailureModel] = []
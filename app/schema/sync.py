@@ -0,0 +1,33 @@
+"""
+Schema for the synchronisation with OC
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class PendingSessionModel(BaseModel):
+    id: int
+    sessionDate: datetime
+
+
+class SyncStateModel(BaseModel):
+    id: int
+    last_session_date: Optional[datetime] = None
+    last_session_id: Optional[int] = None
+    last_sync: Optional[datetime] = None
+    pending: List[PendingSessionModel] = []
+
+
+class SchedulerMetricsModel(BaseModel):
+    running: bool = False
+    last_start: Optional[datetime] = None
+    last_duration: Optional[float] = None
+    last_status: Optional[str] = None
+    last_error: Optional[str] = None
+    last_progress: Dict[str, int] = {}
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    next_run: Optional[datetime] = None
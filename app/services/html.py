@@ -0,0 +1,98 @@
+"""
+Render the invoices to HTML with the invoice template, compiled once and rendered straight to a string
+"""
+import hashlib
+import logging
+from typing import Optional, Tuple
+
+from jinja2 import Template, TemplateNotFound
+from starlette.requests import Request
+from starlette.templating import Jinja2Templates
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.utils import invoice_content_hash
+from app.schema.invoice import InvoiceOutModel
+
+logger = logging.getLogger(__name__)
+
+
+class InvoiceTemplate:
+    def __init__(self, directory: str, name: str, cache_size: int, cache_ttl: float):
+        """
+        Invoice template with a cache of the HTML rendered, by invoice version and date
+        :param directory: str, directory of the templates
+        :param name: str, file name of the invoice template
+        :param cache_size: int, maximum number of HTML kept
+        :param cache_ttl: float, seconds an HTML is kept
+        """
+        self.templates = Jinja2Templates(directory=directory)
+        # The template is compiled once, never read again from disk
+        self.templates.env.auto_reload = False
+        self.name = name
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self._template = None
+        self._version = None
+
+    def load(self) -> Optional[Template]:
+        """
+        Compile the template (on app startup), its version is the hash of its source
+        :return: Template or None if the template is missing
+        """
+        try:
+            source, _, _ = self.templates.env.loader.get_source(self.templates.env, self.name)
+            # Without auto_reload the environment would keep the template compiled before
+            self.templates.env.cache.clear()
+            self._template = self.templates.env.get_template(self.name)
+        except TemplateNotFound:
+            logger.error("Invoice template %s not found", self.name)
+            return None
+        self._version = hashlib.sha256(source.encode()).hexdigest()
+        self.cache.clear()
+        return self._template
+
+    @property
+    def template(self) -> Template:
+        if self._template is None and self.load() is None:
+            raise TemplateNotFound(self.name)
+        return self._template
+
+    @property
+    def version(self) -> str:
+        """
+        Hash of the template source, a new template makes every HTML and PDF cached stale
+        :return: str
+        """
+        if self._version is None and self.load() is None:
+            raise TemplateNotFound(self.name)
+        return self._version
+
+    def etag(self, invoice: InvoiceOutModel, date: str) -> str:
+        """
+        ETag of the HTML of the invoice rendered at the date
+        :param invoice: InvoiceOutModel
+        :param date: str, date printed on the invoice
+        :return: str, quoted ETag
+        """
+        content = "{}|{}|{}".format(invoice.id, invoice_content_hash(invoice, self.version), date)
+        return '"{}"'.format(hashlib.sha256(content.encode()).hexdigest())
+
+    def render(self, invoice: InvoiceOutModel, date: str, request: Optional[Request] = None) -> Tuple[str, str]:
+        """
+        HTML of the invoice, rendered only if this version of the invoice is not in cache
+        :param invoice: InvoiceOutModel
+        :param date: str, date printed on the invoice
+        :param request: Request, for url_for in the template
+        :return: HTML and its ETag
+        """
+        etag = self.etag(invoice, date)
+        if (html := self.cache.get(etag)) is None:
+            html = self.template.render({"request": request, "invoice": invoice.dict(), "date": date})
+            self.cache.set(etag, html)
+        return html, etag
+
+
+invoice_template = InvoiceTemplate("app/templates",
+                                   "invoice.html",
+                                   settings.HTML_CACHE_SIZE,
+                                   settings.HTML_CACHE_TTL)
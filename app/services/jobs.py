@@ -0,0 +1,107 @@
+"""
+In-process runner for the long operations (synchronisation, bulk cancellation, invoices batch).
+The jobs run as asyncio tasks, their state is saved in DB at each step
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+
+from app.core.db import MongoDB, mongodb
+from app.core.utils import Progress
+from app.crud.job import find_job, save_job, interrupt_jobs
+from app.schema.jobs import JobModel, JobStatusEnum
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    def __init__(self, mongo: MongoDB = mongodb):
+        """
+        Jobs running in this process, by job id
+        :param mongo: MongoDB, where the jobs are saved
+        """
+        self.mongo = mongo
+        self._jobs: Dict[str, JobModel] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def submit(self, kind: str, function: Callable[[Progress], Awaitable[Any]]) -> JobModel:
+        """
+        Run an operation in background
+        :param kind: str, name of the operation
+        :param function: coroutine function called with the Progress of the job, its result is saved in the job
+        :return: JobModel
+        """
+        job = await save_job(JobModel(id=str(uuid.uuid4()), kind=kind, created_at=datetime.utcnow()), self.mongo)
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, function))
+        return job
+
+    async def _run(self, job: JobModel, function: Callable[[Progress], Awaitable[Any]]):
+        try:
+            job.status, job.started_at = JobStatusEnum.running, datetime.utcnow()
+            await save_job(job, self.mongo)
+            job.result = jsonable_encoder(await function(Progress(job.progress)))
+            job.status = JobStatusEnum.done
+        except asyncio.CancelledError:
+            job.status = JobStatusEnum.cancelled
+        except HTTPException as error:
+            job.status, job.error = JobStatusEnum.failed, str(error.detail)
+        except Exception as error:
+            logger.exception("Job %s %s failed", job.kind, job.id)
+            job.status, job.error = JobStatusEnum.failed, repr(error)
+        job.finished_at = datetime.utcnow()
+        try:
+            await save_job(job, self.mongo)
+        finally:
+            self._jobs.pop(job.id, None)
+            self._tasks.pop(job.id, None)
+
+    async def get(self, id: str) -> Optional[JobModel]:
+        """
+        State of a job, the jobs running are read in memory for an up to date progress
+        :param id: str, job id
+        :return: JobModel or None if the job does not exist
+        """
+        return self._jobs.get(id) or await find_job(id, self.mongo)
+
+    async def cancel(self, id: str) -> Optional[JobModel]:
+        """
+        Cancel a job running in this process
+        :param id: str, job id
+        :return: JobModel once cancelled, None if the job is not running
+        """
+        if task := self._tasks.get(id):
+            job = self._jobs[id]
+            task.cancel()
+            await asyncio.wait([task])
+            if task.cancelled():
+                # Cancelled before its first step: _run never saved the end of the job
+                job.status, job.finished_at = JobStatusEnum.cancelled, datetime.utcnow()
+                self._jobs.pop(id, None)
+                self._tasks.pop(id, None)
+                await save_job(job, self.mongo)
+            return job
+
+    async def start(self):
+        """
+        Mark the jobs of the previous run of the app as interrupted (on app startup)
+        :return:
+        """
+        if interrupted := await interrupt_jobs(self.mongo):
+            logger.warning("%s jobs interrupted by the last shutdown", interrupted)
+
+    async def close(self):
+        """
+        Cancel the jobs still running (on app shutdown)
+        :return:
+        """
+        for id in list(self._tasks):
+            await self.cancel(id)
+
+
+job_runner = JobRunner()
@@ -1,17 +1,64 @@
 """
 Services for interacting with api.OC and OC website
 """
+import asyncio
+import logging
 import re
-from datetime import timedelta
-from typing import Tuple, Union
+from datetime import timedelta, datetime
+from typing import Tuple, Union, List, Optional
 
-import requests
 from fastapi import HTTPException
 from starlette import status
 
-from app.core.db import mongodb
+from app.core.cache import token_cache, stale_token_cache
+from app.core.config import settings
+from app.core.credentials import credentials
+from app.core.http import oc_client, cookie_header
+from app.core.utils import get_range, merge_pages, Progress
 from app.schema.sessions import SessionScheduleInModel, SessionScheduleRequestModel
 
+logger = logging.getLogger(__name__)
+
+
+class StudentStatusParser:
+    pattern = re.compile(r'<div class="mentorshipStudent__details oc-typography-body1"><p>([^<]+)</p>')
+    prefix = '<div class="mentorshipStudent__details oc-typography-body1"><p>'
+
+    def __init__(self):
+        """
+        Find the student status in the dashboard page fed chunk by chunk, new lines are ignored.
+        Only the text which can still be part of the status block is kept between chunks
+        """
+        self._buffer = ""
+        self.status = None
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Parse the next chunk of the page
+        :param chunk: str
+        :return: str, the status once found, None before
+        """
+        if self.status is not None:
+            return self.status
+        self._buffer += chunk.replace('\n', '')
+        start = self._buffer.find(self.prefix)
+        if start == -1:
+            self._buffer = self._buffer[-(len(self.prefix) - 1):]
+            return None
+        if match := self.pattern.search(self._buffer, start):
+            self.status = match.group(1).strip()
+            self._buffer = ""
+            return self.status
+        start = self._buffer.rfind(self.prefix)
+        status = self._buffer[start + len(self.prefix):]
+        end = status.find('<')
+        if end == -1 or (end > 0 and '</p>'.startswith(status[end:])):
+            # Status block opened, its end is in the next chunks
+            self._buffer = self._buffer[start:]
+        else:
+            self._buffer = self._buffer[-(len(self.prefix) - 1):]
+        return None
+
 
 async def login_oc(mail, pwd) -> dict:
     """
@@ -20,39 +67,53 @@ async def login_oc(mail, pwd) -> dict:
     :param pwd: str
     :return: dict
     """
-    req = requests.get('https://openclassrooms.com/fr/login_ajax')
+    req = await oc_client.get(settings.OC_WEBSITE_URL + '/fr/login_ajax')
 
     cookies = {"PHPSESSID": req.cookies['PHPSESSID']}
     state = req.json()['csrf']
     payload = {"_username": mail,
                '_password': pwd,
                'state': req.json()['csrf']}
-    headers = {'x-requested-with': 'XMLHttpRequest'}
-    req = requests.post("https://openclassrooms.com/login_check",
-                        headers=headers,
-                        cookies=cookies,
-                        data=payload)
+    headers = {'x-requested-with': 'XMLHttpRequest',
+               **cookie_header(cookies["PHPSESSID"])}
+    req = await oc_client.post(settings.OC_WEBSITE_URL + "/login_check",
+                               headers=headers,
+                               data=payload)
+    if req.status_code != 200:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(req.content))
+    cookie, token = req.cookies['PHPSESSID'], req.cookies['access_token']
+    req = await oc_client.get(settings.OC_API_URL + '/me', headers={'Authorization': 'Bearer ' + token})
     if req.status_code != 200:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(req.content))
-    await mongodb.save_cookies({"PHPSESSID": req.cookies['PHPSESSID'], "access_token": req.cookies['access_token']})
-    return {"state": True, "token": req.cookies['access_token']}
+    await credentials.save(req.json()["id"], cookie, token)
+    # Validated tokens hold the previous cookie
+    token_cache.clear()
+    stale_token_cache.clear()
+    return {"state": True, "token": token}
 
 
-def delete_session_oc(session_id, cookie):
-    url = "https://openclassrooms.com/api/mentorship-sessions/" + str(session_id) + "/cancel"
+async def delete_session_oc(session_id, cookie):
+    """
+    Cancel a session on OC website
+    :param session_id: int
+    :param cookie: str to interact with oc website
+    :return: request, cancelled if its status code is 200
+    """
+    url = settings.OC_WEBSITE_URL + "/api/mentorship-sessions/" + str(session_id) + "/cancel"
 
     headers = {"Content-Type": "application/json",
                'Connection': 'keep-alive',
-               'X-Requested-With': 'XMLHttpRequest'}
+               'X-Requested-With': 'XMLHttpRequest',
+               **cookie_header(cookie)}
     payload = "{\"late\": false, \"studentFacingNote\": null}"
-    req = requests.post(url, cookies={"PHPSESSID": cookie}, headers=headers, data=payload)
-    print(req.status_code, req.text)
-    if req.status_code == 200:
-        return req
+    req = await oc_client.post(url, headers=headers, content=payload)
+    if req.status_code != 200:
+        logger.warning("Session %s not cancelled: %s %s", session_id, req.status_code, req.text)
+    return req
 
 
-def update_session_api(user_id, range_min, range_max,
-                       authorization, return_range=False) -> Union[dict, Tuple]:
+async def update_session_api(user_id, range_min, range_max,
+                             authorization, return_range=False, after: datetime = None) -> Union[dict, Tuple]:
     """
     Find all session in the range
     :param user_id:
@@ -60,18 +121,21 @@ def update_session_api(user_id, range_min, range_max,
     :param return_range:
     :param range_min: int
     :param range_max:  int
+    :param after: datetime, only sessions after this date (all sessions if None)
     :return: list of session, nb of session from parameter  Content Range
     """
-    url = 'https://api.openclassrooms.com/users/'
+    url = settings.OC_API_URL + '/users/'
     suffix = str(
         user_id) + '/sessions?actor=expert&life-cycle-status=canceled,' \
                    'completed,late canceled,marked student as absent,pending'
+    if after is not None:
+        suffix += '&after=' + after.strftime("%Y-%m-%dT%H:%M:%SZ")
     headers = {'Authorization': authorization,
                'Content-Type': 'application/json',
                'Range': 'items=' + str(range_min) + "-" + str(range_max),
                'Connection': 'keep-alive',
                'X-Requested-With': 'XMLHttpRequest'}
-    req = requests.get(url + suffix, headers=headers)
+    req = await oc_client.get(url + suffix, headers=headers)
     if req.status_code == 206:
         if return_range:
             return req.json(), int(req.headers['Content-Range'].split('/')[-1])
@@ -80,8 +144,58 @@ def update_session_api(user_id, range_min, range_max,
         return []
 
 
-def find_specific_session(user_id,
-                          authorization, status, after) -> Union[dict, Tuple]:
+async def fetch_all_sessions(user_id, authorization, after: datetime = None,
+                             concurrency: int = settings.OC_SYNC_CONCURRENCY,
+                             progress: Optional[Progress] = None) -> List[dict]:
+    """
+    Fetch every session of the mentor: the first page gives the total (Content-Range),
+    the remaining pages are fetched concurrently and merged back in order.
+    Raise 502 if OC fails to give a page, the first one included
+    :param user_id: str : mentor id
+    :param authorization: str:  Bearer Token
+    :param after: datetime, only sessions after this date (all sessions if None)
+    :param concurrency: int, maximum number of pages requested at the same time
+    :param progress: Progress, counts the pages_fetched
+    :return: list of session, each session is present once
+    """
+    progress = progress or Progress()
+    first_page = await update_session_api(user_id=user_id,
+                                          range_min=0,
+                                          range_max=19,
+                                          return_range=True,
+                                          authorization=authorization,
+                                          after=after)
+    if first_page is None:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                            detail="Issue when fetching the first page of sessions")
+    if not first_page:
+        return []
+    progress.add("pages_fetched")
+    sessions, items_range = first_page
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_page(range_: dict) -> list:
+        async with semaphore:
+            page = await update_session_api(user_id=user_id,
+                                            range_min=range_["range_min"],
+                                            range_max=range_["range_max"],
+                                            authorization=authorization,
+                                            after=after)
+        if page is None:
+            raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY,
+                                detail="Issue when fetching sessions " + str(range_))
+        progress.add("pages_fetched")
+        return page
+
+    pages = await asyncio.gather(*[fetch_page(range_) for range_ in get_range(0, items_range)[1:]])
+    sessions = merge_pages([sessions, *pages])
+    if len(sessions) != items_range:
+        logger.warning("Fetched %s sessions, OC announced %s", len(sessions), items_range)
+    return sessions
+
+
+async def find_specific_session(user_id,
+                                authorization, status, after) -> Union[dict, Tuple]:
     """
     Find all session in the range
     :param after: date : after a date format: Y-m-dTHH:mm:ssZ
@@ -90,7 +204,7 @@ def find_specific_session(user_id,
     :param authorization: str:  Bearer Token
     :return: list of session, nb of session from parameter  Content Range
     """
-    url = 'https://api.openclassrooms.com/users/'
+    url = settings.OC_API_URL + '/users/'
     before = (after + timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
     after = (after - timedelta(minutes=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
     suffix = str(
@@ -99,12 +213,12 @@ def find_specific_session(user_id,
                'Content-Type': 'application/json',
                'Connection': 'keep-alive',
                'X-Requested-With': 'XMLHttpRequest'}
-    req = requests.get(url + suffix, headers=headers)
+    req = await oc_client.get(url + suffix, headers=headers)
     if req.status_code == 200:
         return req.json()
 
 
-def get_student_type(student_id, authorization, cookie) -> dict:
+async def get_student_type(student_id, authorization, cookie) -> dict:
     """
     Get student type
     :param student_id: int
@@ -112,43 +226,45 @@ def get_student_type(student_id, authorization, cookie) -> dict:
     :param cookie: str to interact with oc website
     :return: dict
     """
-    rx_student_status = re.compile(r'<div class="mentorshipStudent__details oc-typography-body1"><p>([^<]+)</p>')
-
-    url = 'https://openclassrooms.com/fr/mentorship/students/' + str(student_id) + '/dashboard'
-    req = requests.get(url, cookies={"PHPSESSID": cookie})
-    if req.status_code != 200:
-        raise RuntimeError(f'{req.url} returned {req.status_code}')
-
-    html = req.text.replace('\n', '')
-    match_status = rx_student_status.search(html)
-    if match_status is not None:
-        status = {"status": match_status.group(1).strip()}
-    else:
-        status = {"status": "Ext"}
+    url = settings.OC_WEBSITE_URL + '/fr/mentorship/students/' + str(student_id) + '/dashboard'
+    parser = StudentStatusParser()
+    async with oc_client.stream("GET", url, headers=cookie_header(cookie)) as req:
+        if req.status_code != 200:
+            raise RuntimeError(f'{req.url} returned {req.status_code}')
+        size = 0
+        async for chunk in req.aiter_text():
+            size += len(chunk)
+            if parser.feed(chunk) is not None:
+                break
+            if size > settings.OC_DASHBOARD_MAX_SIZE:
+                logger.warning("No status in the first %s characters of %s", size, req.url)
+                break
+    status = {"status": parser.status if parser.status is not None else "Ext"}
 
-    url = 'https://api.openclassrooms.com/users/'
+    url = settings.OC_API_URL + '/users/'
     suffix = str(student_id)
     headers = {'Authorization': authorization,
                'Content-Type': 'application/json',
                'Connection': 'keep-alive',
                'X-Requested-With': 'XMLHttpRequest'}
-    req = requests.get(url + suffix, headers=headers)
+    req = await oc_client.get(url + suffix, headers=headers)
     if req.status_code == 200:
         return {**req.json(), **status}
 
 
-def schedule_meeting(schedule: SessionScheduleRequestModel, cookie):
+async def schedule_meeting(schedule: SessionScheduleRequestModel, cookie):
     """
     Schedule a meeting on a date with a student
     :param schedule: SessionScheduleRequestModel
     :param cookie: str to interact with oc website
     :return: request
     """
-    url = "https://openclassrooms.com/api/mentorship-sessions"
+    url = settings.OC_WEBSITE_URL + "/api/mentorship-sessions"
 
     headers = {"Content-Type": "text/plain;charset=UTF-8",
                'Connection': 'keep-alive',
-               'X-Requested-With': 'XMLHttpRequest'}
-    req = requests.post(url, cookies={"PHPSESSID": cookie}, headers=headers, data=schedule.json())
+               'X-Requested-With': 'XMLHttpRequest',
+               **cookie_header(cookie)}
+    req = await oc_client.post(url, headers=headers, content=schedule.json())
     if req.status_code == 201 or req.status_code == 400 or req.status_code == 409 or req.status_code == 403:
         return req
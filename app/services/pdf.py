@@ -0,0 +1,91 @@
+"""
+Render the invoices to PDF with wkhtmltopdf, in subprocesses so the event loop is never blocked
+"""
+import asyncio
+import logging
+
+import pdfkit
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFullError(Exception):
+    def __init__(self, retry_after: float):
+        """
+        Raised when too many renders are already running or waiting
+        :param retry_after: float, seconds before trying again
+        """
+        super().__init__("Too many PDF renders in progress")
+        self.retry_after = retry_after
+
+
+class PDFRenderer:
+    def __init__(self, workers: int, queue_size: int, timeout: float, retry_after: float):
+        """
+        Pool of wkhtmltopdf subprocesses
+        :param workers: int, renders running at the same time
+        :param queue_size: int, renders waiting for a worker, more are refused
+        :param timeout: float, seconds a render may take, waiting time excluded
+        :param retry_after: float, seconds suggested to the callers refused
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._semaphore = None
+        self._pending = 0
+        self._configuration = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        return self._semaphore
+
+    async def render(self, html: str) -> bytes:
+        """
+        Render the html to PDF, raise RenderQueueFullError at once if the queue is full
+        and asyncio.TimeoutError if wkhtmltopdf takes longer than the timeout
+        :param html: str
+        :return: bytes, the PDF
+        """
+        if self._pending >= self.workers + self.queue_size:
+            raise RenderQueueFullError(self.retry_after)
+        self._pending += 1
+        try:
+            async with self.semaphore:
+                return await self._render(html)
+        finally:
+            self._pending -= 1
+
+    async def _render(self, html: str) -> bytes:
+        if self._configuration is None:
+            # Locate wkhtmltopdf once
+            self._configuration = pdfkit.configuration()
+        # Same command as pdfkit.from_string(html, output_path=False): html on stdin, PDF on stdout
+        args = pdfkit.PDFKit(html, 'string', configuration=self._configuration).command()
+        process = await asyncio.create_subprocess_exec(*args,
+                                                       stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(html.encode('utf-8')), self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+        stderr = stderr.decode('utf-8', errors='replace')
+        lines = stderr.splitlines()
+        # wkhtmltopdf may exit with non-zero even if it finishes generation
+        if process.returncode != 0 and not (len(lines) > 1 and lines[-2].strip() == 'Done'):
+            raise IOError("wkhtmltopdf exited with non-zero code {0}. error:\n{1}".format(process.returncode,
+                                                                                          stderr))
+        return stdout
+
+
+pdf_renderer = PDFRenderer(settings.PDF_WORKERS,
+                           settings.PDF_QUEUE_SIZE,
+                           settings.PDF_TIMEOUT,
+                           settings.PDF_RETRY_AFTER)
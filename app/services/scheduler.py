@@ -0,0 +1,115 @@
+"""
+Periodic synchronisation of the sessions of every mentor logged in
+"""
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+from starlette import status
+
+from app.core.config import settings
+from app.core.credentials import credentials
+from app.core.utils import Progress
+from app.schema.sync import SchedulerMetricsModel
+from app.services.sync import sync_sessions
+
+logger = logging.getLogger(__name__)
+
+
+class SyncScheduler:
+    def __init__(self, interval: float, jitter: float, backoff_base: float, backoff_max: float):
+        """
+        Run the synchronisation every interval seconds, give or take jitter (fraction of the interval).
+        After a failed run, the next one waits backoff_base seconds doubled at each failure, up to backoff_max
+        :param interval: float, seconds between two runs
+        :param jitter: float, fraction of the delay drawn at random
+        :param backoff_base: float, seconds before the run following a failure
+        :param backoff_max: float, maximum seconds between two runs after failures
+        """
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = SchedulerMetricsModel()
+        self._task: Optional[asyncio.Task] = None
+
+    def next_delay(self) -> float:
+        """
+        Seconds before the next run
+        :return: float
+        """
+        if failures := self.metrics.consecutive_failures:
+            delay = min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+        else:
+            delay = self.interval
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    async def run_once(self) -> SchedulerMetricsModel:
+        """
+        Synchronise every mentor logged in, a mentor already being synced is skipped
+        :return: SchedulerMetricsModel
+        """
+        self.metrics.running = True
+        self.metrics.last_start = datetime.utcnow()
+        start, progress, errors, skipped = time.monotonic(), Progress(), [], 0
+        for id in credentials.ids():
+            try:
+                await sync_sessions(credentials.user(id), progress=progress)
+            except HTTPException as error:
+                if error.status_code == status.HTTP_409_CONFLICT:
+                    skipped += 1
+                else:
+                    errors.append(f"{id}: {error.status_code} {error.detail}")
+            except Exception as error:
+                logger.exception("Synchronisation of %s failed", id)
+                errors.append(f"{id}: {error!r}")
+        self.metrics.running = False
+        self.metrics.last_duration = time.monotonic() - start
+        self.metrics.last_progress = progress.counters
+        self.metrics.runs += 1
+        if errors:
+            self.metrics.last_status, self.metrics.last_error = "failed", "; ".join(errors)
+            self.metrics.failures += 1
+            self.metrics.consecutive_failures += 1
+        else:
+            self.metrics.last_status = "skipped" if skipped else "done"
+            self.metrics.last_error = None
+            self.metrics.consecutive_failures = 0
+        return self.metrics
+
+    async def _run(self, delay: float):
+        while True:
+            self.metrics.next_run = datetime.utcnow() + timedelta(seconds=delay)
+            await asyncio.sleep(delay)
+            await self.run_once()
+            if self.metrics.last_status == "failed":
+                logger.warning("Scheduled synchronisation failed: %s", self.metrics.last_error)
+            delay = self.next_delay()
+
+    def start(self):
+        """
+        Start the runs (on app startup), the first one within the jitter of the interval
+        :return:
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(self.interval * random.uniform(0, self.jitter)))
+
+    async def close(self):
+        """
+        Stop the runs (on app shutdown)
+        :return:
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait([self._task])
+            self._task = None
+
+
+sync_scheduler = SyncScheduler(settings.SYNC_INTERVAL,
+                               settings.SYNC_JITTER,
+                               settings.SYNC_BACKOFF_BASE,
+                               settings.SYNC_BACKOFF_MAX)
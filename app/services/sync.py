@@ -0,0 +1,194 @@
+"""
+Services for synchronising the DB with OC
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+import pydantic
+from fastapi import HTTPException
+from starlette import status
+
+from app.core.breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.credentials import credentials
+from app.core.utils import to_naive_utc, Progress
+from app.crud.session import upsert_sessions
+from app.crud.student import get_distinct, find_unknown_students, create_students, find_students_to_refresh, \
+    update_student_profile
+from app.crud.sync import find_sync_state, save_sync_state
+from app.schema.authentification import UserAuth
+from app.schema.sessions import SessionModel
+from app.schema.sync import SyncStateModel, PendingSessionModel
+from app.schema.users import UserModel
+from app.services.oc_api import fetch_all_sessions, get_student_type
+
+PENDING_STATUS = "pending"
+
+logger = logging.getLogger(__name__)
+
+# Synchronisation running for each mentor, a mentor is never synced twice at the same time
+sync_locks: Dict[int, asyncio.Lock] = {}
+
+
+def sync_lower_bound(state: SyncStateModel) -> Optional[datetime]:
+    """
+    Date from which OC has to be asked for sessions:
+    sessions still pending can change, sessions scheduled since the last sync are after it
+    :param state: SyncStateModel
+    :return: datetime or None if the whole history has to be fetched
+    """
+    if state.last_sync is None:
+        return None
+    dates = [state.last_sync] + [session.sessionDate for session in state.pending]
+    if state.last_session_date is not None:
+        dates.append(state.last_session_date)
+    return min(dates) - timedelta(hours=settings.SYNC_SLACK_HOURS)
+
+
+def update_sync_state(state: SyncStateModel, sessions: List[SessionModel], started: datetime) -> SyncStateModel:
+    """
+    Compute the new synchronisation state from the sessions fetched
+    :param state: SyncStateModel, state before the synchronisation
+    :param sessions: sessions fetched from OC
+    :param started: datetime, start of the synchronisation
+    :return: SyncStateModel
+    """
+    last_date, last_id = state.last_session_date, state.last_session_id
+    pending = []
+    for session in sessions:
+        date = to_naive_utc(session.sessionDate)
+        if last_date is None or (date, session.id) > (last_date, last_id or 0):
+            last_date, last_id = date, session.id
+        if session.status == PENDING_STATUS:
+            pending.append(PendingSessionModel(id=session.id, sessionDate=date))
+    return SyncStateModel(id=state.id,
+                          last_session_date=last_date,
+                          last_session_id=last_id,
+                          last_sync=started,
+                          pending=pending)
+
+
+async def enrich_students(user: UserAuth,
+                          concurrency: int = settings.OC_SYNC_CONCURRENCY,
+                          progress: Optional[Progress] = None) -> List[UserModel]:
+    """
+    Fetch from OC the students of the sessions which are not in DB yet.
+    The lookups run concurrently, the students are inserted at once.
+    A student OC fails to give is skipped, it is fetched again on the next sync
+    :param user: UserAuth
+    :param concurrency: int, maximum number of students fetched at the same time
+    :param progress: Progress, counts the students_enriched
+    :return: List[UserModel] created
+    """
+    progress = progress or Progress()
+    unknown = await find_unknown_students(await get_distinct())
+    if not unknown:
+        return []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_student(student_id: int) -> Optional[UserModel]:
+        async with semaphore:
+            try:
+                student = await get_student_type(student_id, user.token, user.cookie)
+            except (RuntimeError, httpx.HTTPError, CircuitOpenError) as error:
+                logger.warning("Student %s not fetched: %r", student_id, error)
+                return None
+        if student is None:
+            logger.warning("Student %s not found on OC", student_id)
+            return None
+        progress.add("students_enriched")
+        return UserModel(**student)
+
+    students = await asyncio.gather(*[fetch_student(student_id) for student_id in unknown])
+    return await create_students([student for student in students if student is not None])
+
+
+async def sync_sessions(user: UserAuth, full: bool = False,
+                        progress: Optional[Progress] = None) -> List[SessionModel]:
+    """
+    Synchronise the sessions of the mentor from OC, then fetch the new students.
+    Only the sessions after the high-water mark and the pending ones are requested,
+    unless a full synchronisation is asked. Raise 409 if the mentor is already being synced
+    :param user: UserAuth
+    :param full: bool, fetch the whole history
+    :param progress: Progress, counts the pages_fetched, sessions_upserted and students_enriched
+    :return: List[SessionModel]
+    """
+    lock = sync_locks.setdefault(user.id, asyncio.Lock())
+    if lock.locked():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Synchronisation already running")
+    async with lock:
+        return await _sync_sessions(user, full, progress or Progress())
+
+
+async def _sync_sessions(user: UserAuth, full: bool, progress: Progress) -> List[SessionModel]:
+    state = SyncStateModel(id=user.id) if full else await find_sync_state(user.id)
+    after = sync_lower_bound(state)
+    started = datetime.utcnow()
+    sessions = await fetch_all_sessions(user_id=user.id, authorization=user.token, after=after, progress=progress)
+    if not sessions and after is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Issue when fetching")
+    result = []
+    for session in sessions:
+        del session["expert"]
+        session["recipient"] = session["recipient"]["id"]
+        try:
+            result.append(SessionModel(**session))
+        except pydantic.error_wrappers.ValidationError:
+            pass
+    await upsert_sessions(result)
+    progress.add("sessions_upserted", len(result))
+    await save_sync_state(update_sync_state(state, result, started))
+    await enrich_students(user, progress=progress)
+    return result
+
+
+async def refresh_students(user: UserAuth,
+                           ttl: timedelta = timedelta(hours=settings.STUDENT_REFRESH_TTL_HOURS),
+                           rate: float = settings.STUDENT_REFRESH_RATE) -> int:
+    """
+    Fetch again from OC the students whose profile is outdated, so their status (used for the price) stays right.
+    The students are fetched one after the other, at most rate students per second.
+    A student OC fails to give is skipped, the refresh stops if OC is unavailable
+    :param user: UserAuth
+    :param ttl: timedelta, maximum age of a profile
+    :param rate: float, maximum number of students fetched per second
+    :return: int, number of students whose status or name changed
+    """
+    changed = 0
+    for index, student_id in enumerate(await find_students_to_refresh(ttl)):
+        if index:
+            await asyncio.sleep(1 / rate)
+        try:
+            student = await get_student_type(student_id, user.token, user.cookie)
+        except CircuitOpenError as error:
+            logger.warning("Students refresh stopped: %s", error)
+            break
+        except (RuntimeError, httpx.HTTPError) as error:
+            logger.warning("Student %s not refreshed: %r", student_id, error)
+            continue
+        if student is None:
+            logger.warning("Student %s not found on OC", student_id)
+            continue
+        changed += await update_student_profile(UserModel(**student))
+    return changed
+
+
+async def student_refresher(interval: float = settings.STUDENT_REFRESH_INTERVAL):
+    """
+    Refresh the outdated students every interval seconds, with the credentials of any mentor logged in
+    :param interval: float, seconds between two refreshes
+    :return:
+    """
+    while True:
+        if mentors := credentials.ids():
+            user = credentials.user(mentors[0])
+            try:
+                if changed := await refresh_students(user):
+                    logger.info("%s students changed on OC", changed)
+            except Exception:
+                logger.exception("Students refresh failed")
+        await asyncio.sleep(interval)
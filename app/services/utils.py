@@ -1,11 +1,19 @@
+import asyncio
 from datetime import datetime
+from typing import List, Optional
+
+import httpx
 
 from fastapi import HTTPException
 from starlette import status
 
-from app.crud.session import find_session_by_date, create_session
-from app.schema.sessions import SessionScheduleRequestModel, SessionModel
-from app.services.oc_api import schedule_meeting, find_specific_session
+from app.core.breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.utils import Progress
+from app.crud.session import find_session_by_date, create_session, delete_sessions
+from app.schema.sessions import SessionScheduleRequestModel, SessionModel, SessionOutModel, SessionCancelOutModel, \
+    SessionCancelFailureModel
+from app.services.oc_api import schedule_meeting, find_specific_session, delete_session_oc
 
 
 async def schedule_session_wrapper(studentId, user, eventStart):
@@ -16,12 +24,12 @@ async def schedule_session_wrapper(studentId, user, eventStart):
     if sessions := await find_session_by_date(date=new_session.sessionDate, duration=60):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A session exist at the same date")
 
-    session_oc = schedule_meeting(new_session, user.cookie)
+    session_oc = await schedule_meeting(new_session, user.cookie)
     if session_oc is not None:
         if session_oc.status_code != 201:
             raise HTTPException(status_code=session_oc.status_code, detail=session_oc.text)
         # find session in OC
-        session = find_specific_session(user.id, user.token, "pending", after=new_session.sessionDate)
+        session = await find_specific_session(user.id, user.token, "pending", after=new_session.sessionDate)
         if session:
             session = session[0]
             del session["expert"]
@@ -29,3 +37,38 @@ async def schedule_session_wrapper(studentId, user, eventStart):
             if await create_session(SessionModel(**session)):
                 return session
         raise HTTPException(status_code=session_oc.status_code, detail="Session not in OC")
+
+
+async def cancel_sessions(sessions: List[SessionOutModel], cookie: str,
+                          concurrency: int = settings.OC_SYNC_CONCURRENCY,
+                          progress: Optional[Progress] = None) -> SessionCancelOutModel:
+    """
+    Cancel the sessions on OC concurrently, then delete the ones cancelled from DB at once
+    :param sessions: List[SessionOutModel]
+    :param cookie: str to interact with oc website
+    :param concurrency: int, maximum number of sessions cancelled at the same time
+    :param progress: Progress, counts the sessions_cancelled
+    :return: SessionCancelOutModel, sessions cancelled and sessions OC did not cancel with the reason
+    """
+    progress = progress or Progress()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def cancel(session: SessionOutModel) -> Optional[str]:
+        async with semaphore:
+            try:
+                req = await delete_session_oc(session.id, cookie)
+            except (httpx.HTTPError, CircuitOpenError) as error:
+                return repr(error)
+        if req.status_code != 200:
+            return f"OC returned {req.status_code}: {req.text}"
+        progress.add("sessions_cancelled")
+
+    reasons = await asyncio.gather(*[cancel(session) for session in sessions])
+    result = SessionCancelOutModel()
+    for session, reason in zip(sessions, reasons):
+        if reason is None:
+            result.succeeded.append(session)
+        else:
+            result.failed.append(SessionCancelFailureModel(id=session.id, reason=reason))
+    await delete_sessions([session.id for session in result.succeeded])
+    return result
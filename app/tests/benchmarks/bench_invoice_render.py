@@ -0,0 +1,96 @@
+"""
+Microbenchmark of the invoice HTML rendering, per invoice of 5, 50 and 500 items:
+- before: TemplateResponse built for each request, its body decoded back to a string
+- after: template compiled once and rendered straight to a string
+- cached: same invoice version rendered again
+
+The invoice template is not shipped with the repository, a stand-in template is used
+if app/templates/invoice.html is missing
+
+python -m app.tests.benchmarks.bench_invoice_render
+"""
+import os
+import tempfile
+import time
+
+from starlette.requests import Request
+from starlette.templating import Jinja2Templates
+
+from app.schema.invoice import InvoiceItem, InvoiceOutModel
+from app.services.html import InvoiceTemplate
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "templates")
+REPEAT = 500
+DATE = "01/06/2021"
+
+STAND_IN = """<html><head><meta charset="utf-8"><title>Facture {{ invoice.id }}</title></head>
+<body>
+<h1>Facture {{ invoice.id }}</h1>
+<p>Date : {{ date }} - Statut : {{ invoice.status }}</p>
+<table>
+<tr><th>Type</th><th>Niveau</th><th>Statut</th><th>Financement</th><th>Quantité</th><th>Prix unitaire</th><th>Prix</th></tr>
+{% for item in invoice.item %}
+<tr><td>{{ item.type }}</td><td>{{ item.projectLevel }}</td><td>{{ item.status }}</td>
+<td>{{ item.student_status }}</td><td>{{ item.count }}</td>
+<td>{{ "%.2f"|format(item.unit_price) }} €</td><td>{{ "%.2f"|format(item.price) }} €</td></tr>
+{% endfor %}
+</table>
+<p>Total : {{ "%.2f"|format(invoice.total) }} €</p>
+</body></html>
+"""
+
+
+def invoice(size: int) -> InvoiceOutModel:
+    items = [InvoiceItem(type="mentoring", projectLevel=str(i % 6 + 1), status="completed",
+                         student_status="Auto-financé", count=i % 4 + 1, unit_price=30, price=30 * (i % 4 + 1))
+             for i in range(size)]
+    return InvoiceOutModel(id="OC-2021-05", date="2021-05", total=sum(item.price for item in items), item=items)
+
+
+def before(templates: Jinja2Templates, request: Request, model: InvoiceOutModel) -> str:
+    return templates.TemplateResponse("invoice.html",
+                                      {"request": request, "invoice": model.dict(), "date": DATE}).body.decode("utf8")
+
+
+def after(template: InvoiceTemplate, request: Request, model: InvoiceOutModel) -> str:
+    template.cache.clear()
+    return template.render(model, DATE, request)[0]
+
+
+def cached(template: InvoiceTemplate, request: Request, model: InvoiceOutModel) -> str:
+    return template.render(model, DATE, request)[0]
+
+
+def percentiles(function, *args):
+    timings = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2], timings[int(len(timings) * 0.99)]
+
+
+def main(directory: str):
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    templates = Jinja2Templates(directory=directory)
+    template = InvoiceTemplate(directory, "invoice.html", 16, 60)
+    template.load()
+    for size in (5, 50, 500):
+        model = invoice(size)
+        assert before(templates, request, model) == after(template, request, model)
+        for label, function, state in (("before", before, templates),
+                                       ("after", after, template),
+                                       ("cached", cached, template)):
+            p50, p99 = percentiles(function, state, request, model)
+            print(f"{size:4} items {label:6} p50 {p50 * 1e6:10.1f} us p99 {p99 * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    if os.path.exists(os.path.join(TEMPLATES, "invoice.html")):
+        main(TEMPLATES)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "invoice.html"), "w", encoding="utf-8") as file:
+                file.write(STAND_IN)
+            main(directory)
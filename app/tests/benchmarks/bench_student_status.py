@@ -0,0 +1,64 @@
+"""
+Microbenchmark of the student status scraping, per student dashboard:
+- before: the whole page is read, copied without new lines and searched
+- after: the page is parsed chunk by chunk and the reading stops at the status
+
+python -m app.tests.benchmarks.bench_student_status
+"""
+import os
+import re
+import time
+import tracemalloc
+
+from app.services.oc_api import StudentStatusParser
+
+FIXTURES = os.path.join(os.path.dirname(__file__), os.pardir, "tests_services", "fixtures")
+CHUNK_SIZE = 65536
+REPEAT = 200
+
+rx_student_status = re.compile(r'<div class="mentorshipStudent__details oc-typography-body1"><p>([^<]+)</p>')
+
+
+def before(html: str):
+    match = rx_student_status.search(html.replace('\n', ''))
+    return match.group(1).strip() if match else None
+
+
+def after(html: str):
+    parser = StudentStatusParser()
+    for start in range(0, len(html), CHUNK_SIZE):
+        if parser.feed(html[start:start + CHUNK_SIZE]) is not None:
+            break
+    return parser.status
+
+
+def dashboard(name: str, size: int) -> str:
+    """
+    Fixture padded with scripts and project lists up to the size of a real dashboard
+    """
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as file:
+        html = file.read()
+    line = '<li class="mentorshipStudent__project">Projet - Parcours Développeur d\'application - Python</li>\n'
+    padding = line * ((size - len(html)) // len(line))
+    return html.replace("</main>", padding + "</main>")
+
+
+def measure(function, html: str):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        function(html)
+    cpu = (time.perf_counter() - start) / REPEAT
+    tracemalloc.start()
+    function(html)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return cpu, peak
+
+
+if __name__ == "__main__":
+    for name in ("dashboard_self_funded.html", "dashboard_late_status.html", "dashboard_no_status.html"):
+        html = dashboard(name, 500_000)
+        assert before(html) == after(html)
+        for label, function in (("before", before), ("after", after)):
+            cpu, peak = measure(function, html)
+            print(f"{name:35} {label:6} {cpu * 1e6:10.1f} us {peak / 1024:10.1f} KiB")
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from app.core.breaker import CircuitBreaker, CircuitOpenError
+
+
+def test_circuit_breaker_open():
+    breaker = CircuitBreaker("sessions", threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before()
+        breaker.failure()
+    breaker.before()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.closed
+
+    for _ in range(3):
+        breaker.before()
+        breaker.failure()
+    assert breaker.state == CircuitBreaker.open
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before()
+    assert 59 < error.value.retry_after <= 60
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker("auth", threshold=1, reset_timeout=0.05)
+    breaker.failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    time.sleep(0.06)
+
+    # One probe at a time
+    breaker.before()
+    assert breaker.state == CircuitBreaker.half_open
+    with pytest.raises(CircuitOpenError):
+        breaker.before()
+    breaker.failure()
+    assert breaker.state == CircuitBreaker.open
+
+    time.sleep(0.06)
+    breaker.before()
+    breaker.success()
+    assert breaker.state == CircuitBreaker.closed
+    breaker.before()
@@ -0,0 +1,25 @@
+import time
+
+from app.core.cache import TTLCache
+
+
+def test_ttl_cache_expire():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set("token", 1)
+    assert cache.get("token") == 1
+    time.sleep(0.06)
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+
+def test_ttl_cache_lru():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    cache.clear()
+    assert cache.get("a") is None
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.breaker import CircuitOpenError
+from app.core.http import OCClient, TokenBucket, retry_after
+
+
+def oc_client(handler, breaker_threshold: int = 100) -> OCClient:
+    client = OCClient(max_connections=5, max_keepalive=5, keepalive_expiry=5,
+                      connect_timeout=1, read_timeout=1, rate=1000, burst=1000,
+                      retries=2, backoff_base=0.01, backoff_max=0.05,
+                      breaker_threshold=breaker_threshold, breaker_reset=60)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_retry_after():
+    assert retry_after(httpx.Response(429, headers={"Retry-After": "3"})) == 3
+    assert retry_after(httpx.Response(429, headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0
+    assert retry_after(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    assert retry_after(httpx.Response(503)) is None
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket():
+    bucket = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    for _ in range(10):
+        await bucket.acquire()
+    # 5 tokens of the burst, then 5 tokens at 50 per second
+    assert 0.08 <= time.monotonic() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_retry_idempotent():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200)
+
+    client = oc_client(handler)
+    assert (await client.get("https://api.openclassrooms.com/me")).status_code == 200
+    assert calls == ["GET"] * 3
+
+    calls.clear()
+    assert (await client.post("https://openclassrooms.com/login_check")).status_code == 503
+    assert calls == ["POST"]
+
+
+@pytest.mark.asyncio
+async def test_retry_exhausted():
+    calls = []
+
+    def handler(request):
+        calls.append(request.method)
+        return httpx.Response(429, headers={"Retry-After": "0"})
+
+    client = oc_client(handler)
+    assert (await client.get("https://api.openclassrooms.com/me")).status_code == 429
+    assert len(calls) == 3
+
+    async with client.stream("GET", "https://openclassrooms.com/fr/dashboard") as response:
+        assert response.status_code == 429
+    assert len(calls) == 6
+
+
+@pytest.mark.asyncio
+async def test_retry_transport_error():
+    errors = []
+
+    def handler(request):
+        if errors:
+            raise errors.pop(0)(request.url.path, request=request)
+        return httpx.Response(201)
+
+    client = oc_client(handler)
+    # Never sent, even a POST is sent again
+    errors[:] = [httpx.ConnectError]
+    assert (await client.post("https://openclassrooms.com/api/mentorship-sessions")).status_code == 201
+
+    # Maybe received by OC, only a GET is sent again
+    errors[:] = [httpx.ReadTimeout]
+    with pytest.raises(httpx.ReadTimeout):
+        await client.post("https://openclassrooms.com/api/mentorship-sessions")
+    errors[:] = [httpx.ReadTimeout, httpx.ReadTimeout]
+    assert (await client.get("https://api.openclassrooms.com/me")).status_code == 201
+    errors[:] = [httpx.ReadTimeout] * 3
+    with pytest.raises(httpx.ReadTimeout):
+        await client.get("https://api.openclassrooms.com/me")
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_families():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if request.url.host == "openclassrooms.com":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200)
+
+    client = oc_client(handler, breaker_threshold=2)
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await client.get("https://openclassrooms.com/fr/mentorship/students/1/dashboard")
+    calls.clear()
+    with pytest.raises(CircuitOpenError):
+        async with client.stream("GET", "https://openclassrooms.com/fr/mentorship/students/1/dashboard"):
+            pass
+    assert calls == []
+    assert (await client.get("https://api.openclassrooms.com/me")).status_code == 200
+    assert (await client.get("https://api.openclassrooms.com/users/1")).status_code == 200
+    assert [breaker.state for breaker in client.breakers.values()] == ["closed", "closed", "open"]
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_server_errors():
+    statuses = []
+
+    def handler(request):
+        return httpx.Response(statuses.pop(0), headers={"Retry-After": "0"})
+
+    client = oc_client(handler, breaker_threshold=2)
+    client.retries = 0
+    # Rate limited, OC is up
+    statuses[:] = [429] * 3
+    for _ in range(3):
+        assert (await client.get("https://api.openclassrooms.com/me")).status_code == 429
+    assert client.breakers["auth"].state == "closed"
+
+    statuses[:] = [503, 500]
+    for _ in range(2):
+        await client.get("https://api.openclassrooms.com/me")
+    assert client.breakers["auth"].state == "open"
@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.core.utils import get_range, merge_pages, month_range, build_invoice, month_list, \
+    invoice_content_hash, if_none_match, parse_range, model_projection, encode_cursor, decode_cursor
+from app.schema.invoice import InvoiceOutModel, InvoiceItem, FileInvoiceOut
+from app.schema.sync import SyncStateModel
+from app.schema.users import UserOutModel
+
+
+def test_get_range():
+    assert get_range(0, 45) == [{"range_min": 0, "range_max": 19},
+                                {"range_min": 20, "range_max": 39},
+                                {"range_min": 40, "range_max": 44}]
+    assert get_range(0, 40) == [{"range_min": 0, "range_max": 19},
+                                {"range_min": 20, "range_max": 39}]
+    assert get_range(0, 0) == []
+
+
+def test_get_range_covers_every_item():
+    for total in range(1, 150):
+        items = [i for range_ in get_range(0, total) for i in range(range_["range_min"], range_["range_max"] + 1)]
+        assert items == list(range(total))
+
+
+def test_merge_pages():
+    pages = [[{"id": 1}, {"id": 2}], [{"id": 2}, {"id": 3}], [], [{"id": 4}]]
+    assert merge_pages(pages) == [{"id": 1}, {"id": 2}, {"id": 3}, {"id": 4}]
+
+
+def test_month_range():
+    assert month_range("2021-05") == (datetime(2021, 5, 1), datetime(2021, 6, 1))
+    assert month_range("2021-12") == (datetime(2021, 12, 1), datetime(2022, 1, 1))
+
+
+async def iterate(groups):
+    for group in groups:
+        yield group
+
+
+@pytest.mark.asyncio
+async def test_build_invoice():
+    groups = [{"projectLevel": level, "type": type_, "status": status, "student_status": student_status,
+               "count": 2, "students": ["student" + level] if student_status == "Auto-financé" else []}
+              for level in "123"
+              for type_ in ["mentoring", "presentation"]
+              for status in ["completed", "marked student as absent"]
+              for student_status in ["Auto-financé", "Financé par un tiers"]]
+    invoice = await build_invoice("2021-05", iterate(groups))
+    assert invoice.id == "OC-2021-05"
+    assert len(invoice.item) == len(groups) + 1
+    assert invoice.item[-1].type == "Forfait inter-sessions"
+    assert invoice.item[-1].count == 3
+    assert invoice.total == sum(item.price for item in invoice.item)
+
+
+def test_month_list():
+    assert month_list("2021-11", "2022-02") == ["2021-11", "2021-12", "2022-01", "2022-02"]
+    assert month_list("2021-05", "2021-05") == ["2021-05"]
+    assert month_list("2021-05", "2021-04") == []
+
+
+def test_invoice_content_hash():
+    invoice = InvoiceOutModel(id="OC-2021-05", date="2021-05", total=60,
+                              item=[InvoiceItem(type="mentoring", count=2, unit_price=30, price=60)])
+    content_hash = invoice_content_hash(invoice, "v1")
+    # The file and the date do not change the rendered content
+    assert invoice_content_hash(invoice.copy(update={"file": FileInvoiceOut(filename="a.pdf")}), "v1") == content_hash
+    assert invoice_content_hash(invoice.copy(update={"status": "Sent"}), "v1") != content_hash
+    assert invoice_content_hash(invoice.copy(update={"total": 90}), "v1") != content_hash
+    assert invoice_content_hash(invoice, "v2") != content_hash
+
+
+def test_if_none_match():
+    assert if_none_match('"abc"', '"abc"')
+    assert if_none_match('"xyz", W/"abc"', '"abc"')
+    assert if_none_match('*', '"abc"')
+    assert not if_none_match('"xyz"', '"abc"')
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=0-9,20-29", 100) is None
+    assert parse_range("items=0-9", 100) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+    with pytest.raises(ValueError):
+        parse_range("bytes=9-0", 100)
+
+
+def test_cursor():
+    last_id = ObjectId()
+    assert decode_cursor(encode_cursor(last_id)) == last_id
+    for cursor in ("not-a-cursor", "YWJj", "%%%"):
+        with pytest.raises(ValueError):
+            decode_cursor(cursor)
+
+
+def test_model_projection():
+    assert model_projection(UserOutModel) == {"_id": 0, "displayName": 1, "id": 1, "email": 1, "status": 1}
+    # Nested models field by field, lists whole
+    assert model_projection(InvoiceOutModel) == {"_id": 0, "date": 1, "status": 1, "id": 1, "total": 1,
+                                                 "item": 1, "file.filename": 1}
+    assert model_projection(SyncStateModel)["pending"] == 1
@@ -9,7 +9,12 @@ class MockedDoc:
                            settings.MONGO_DB,
                            "test_students",
                            "test_sessions",
-                           "test_invoices")
+                           "test_invoices",
+                           "test_sync_state",
+                           "test_billing_rollup",
+                           "test_jobs",
+                           "test_invoice_pdf",
+                           "test_cookies")
     multiple_student = [UserModel(**{"displayName": "testPostDisplayName",
                                      "email": "testPost@gmail.com",
                                      "enrollment": "",
@@ -0,0 +1,75 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.credentials import CredentialStore
+from app.core.http import oc_client
+from app.tests.tests_crud import MockedDoc
+
+
+class TestCredentials(MockedDoc):
+
+    @pytest.fixture(scope="session")
+    def event_loop(self):
+        return asyncio.get_event_loop()
+
+    @pytest.fixture
+    def oc_me(self, monkeypatch):
+        def mock(response: httpx.Response):
+            monkeypatch.setattr(oc_client, "_client",
+                                httpx.AsyncClient(transport=httpx.MockTransport(lambda request: response)))
+        monkeypatch.setattr(oc_client, "retries", 0)
+        return mock
+
+    @pytest.mark.asyncio
+    async def test_save_load(self):
+        await self.mongodb_test.cookie_coll.delete_many({})
+        store = CredentialStore()
+        assert store.get_token() is None
+        await store.save(1, "cookie1", "token1", self.mongodb_test)
+        await store.save(2, "cookie2", "token2", self.mongodb_test)
+        await store.save(1, "cookie1b", "token1b", self.mongodb_test)
+
+        store = CredentialStore()
+        await store.load(self.mongodb_test)
+        assert [1, 2] == sorted(store.ids())
+        assert "cookie1b" == store.get_cookie(1)
+        assert "token2" == store.get_token(2)
+        assert store.get_token() in ("token1b", "token2")
+        assert store.get_cookie(3) is None
+        assert store.get_token(3) is None
+        assert "cookie2" == store.user(2).cookie
+        assert store.user(3) is None
+        assert 2 == await self.mongodb_test.cookie_coll.count_documents({})
+        await self.mongodb_test.cookie_coll.delete_many({})
+
+    @pytest.mark.asyncio
+    async def test_migrate_legacy(self, oc_me):
+        await self.mongodb_test.cookie_coll.delete_many({})
+        legacy = {"PHPSESSID": "cookie", "access_token": "token"}
+
+        # OC unavailable: kept for the next startup
+        await self.mongodb_test.cookie_coll.insert_one(dict(legacy))
+        oc_me(httpx.Response(503))
+        store = CredentialStore()
+        await store.load(self.mongodb_test)
+        assert [] == store.ids()
+        assert await self.mongodb_test.get_legacy_cookies()
+
+        # Stored by mentor id
+        oc_me(httpx.Response(200, json={"id": 5, "email": "mentor@mail.com"}))
+        await store.load(self.mongodb_test)
+        assert [5] == store.ids()
+        assert "cookie" == store.get_cookie(5)
+        assert await self.mongodb_test.get_legacy_cookies() is None
+        assert [5] == [cookies["id"] for cookies in await self.mongodb_test.get_cookies()]
+
+        # Token refused: deleted
+        await self.mongodb_test.cookie_coll.delete_many({})
+        await self.mongodb_test.cookie_coll.insert_one(dict(legacy))
+        oc_me(httpx.Response(401))
+        store = CredentialStore()
+        await store.load(self.mongodb_test)
+        assert [] == store.ids()
+        assert await self.mongodb_test.get_legacy_cookies() is None
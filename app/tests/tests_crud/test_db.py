@@ -0,0 +1,20 @@
+import asyncio
+
+import pytest
+
+from app.tests.tests_crud import MockedDoc
+
+
+class TestIndexes(MockedDoc):
+
+    @pytest.fixture(scope="session")
+    def event_loop(self):
+        return asyncio.get_event_loop()
+
+    @pytest.mark.asyncio
+    async def test_ensure_indexes(self):
+        await self.mongodb_test.ensure_indexes()
+        await self.mongodb_test.ensure_indexes()
+        report = await self.mongodb_test.check_indexes()
+        assert all(not r["missing"] for r in report.values())
+        assert report["test_sessions"]["extra"] == []
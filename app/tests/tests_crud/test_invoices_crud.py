@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from bson import ObjectId
+from gridfs.errors import NoFile
+
+from app.crud.invoice import create_invoices, delete_invoice, find_invoice_by_date, update_pdf_invoice, \
+    find_invoice_pdf, open_invoice_pdf, stream_invoice_pdf
+from app.crud.session import create_session, delete_session
+from app.crud.student import create_student, delete_student
+from app.schema.invoice import FileInvoice
+from app.schema.sessions import SessionModel
+from app.tests.tests_crud import MockedDoc
+
+
+class GridOut:
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+        self.length = len(data)
+        self.chunk_size = 4
+
+    def seek(self, pos: int):
+        self.data.seek(pos)
+
+    async def read(self, size: int) -> bytes:
+        return self.data.read(size)
+
+
+class GridFSBucket:
+    """
+    GridFS bucket in memory, mongomock has no GridFS
+    """
+    def __init__(self):
+        self.files = {}
+
+    async def upload_from_stream(self, filename, source, metadata=None):
+        self.files[file_id := ObjectId()] = source
+        return file_id
+
+    async def open_download_stream(self, file_id):
+        if file_id not in self.files:
+            raise NoFile(file_id)
+        return GridOut(self.files[file_id])
+
+    async def delete(self, file_id):
+        if self.files.pop(file_id, None) is None:
+            raise NoFile(file_id)
+
+
+class TestInvoice(MockedDoc):
+
+    @pytest.fixture(scope="session")
+    def event_loop(self):
+        return asyncio.get_event_loop()
+
+    @pytest.fixture
+    def bucket(self, monkeypatch):
+        bucket = GridFSBucket()
+        monkeypatch.setattr(self.mongodb_test, "_pdf_bucket", bucket)
+        return bucket
+
+    @pytest.mark.asyncio
+    async def test_create_invoices(self):
+        await create_student(self.multiple_student[1], self.mongodb_test)
+        await create_session(SessionModel(**self.multiple_session[1]), self.mongodb_test)
+
+        invoices = await create_invoices("2021-04", "2021-05", self.mongodb_test)
+        assert ["2021-04", "2021-05"] == [invoice.date for invoice in invoices.created]
+        assert [] == invoices.skipped
+        assert [] == invoices.created[0].item
+        may = invoices.created[1]
+        assert 1 == sum(item.count for item in may.item if item.type == "mentoring")
+        assert may == await find_invoice_by_date("2021-05", self.mongodb_test)
+
+        invoices = await create_invoices("2021-05", "2021-06", self.mongodb_test)
+        assert ["2021-06"] == [invoice.date for invoice in invoices.created]
+        assert ["2021-05"] == invoices.skipped
+
+        for month in ("2021-04", "2021-05", "2021-06"):
+            await delete_invoice("OC-" + month, self.mongodb_test)
+        await delete_session(self.multiple_session[1]["id"], self.mongodb_test)
+        await delete_student(self.multiple_student[1].id, self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_update_pdf_invoice(self, bucket):
+        await self.mongodb_test.invoice_coll.insert_one({"id": "OC-2021-05", "date": "2021-05"})
+
+        invoice = await update_pdf_invoice("OC-2021-05", FileInvoice(file=b"first", filename="OC-2021-05.pdf"),
+                                           self.mongodb_test)
+        assert "OC-2021-05" == invoice.id
+        first = await find_invoice_pdf("OC-2021-05", self.mongodb_test)
+        assert (first.filename, first.length) == ("OC-2021-05.pdf", 5)
+        assert hashlib.sha256(b"first").hexdigest() == first.hash
+        assert [first.file_id] == list(bucket.files)
+
+        # The previous pdf is removed from GridFS
+        await update_pdf_invoice("OC-2021-05", FileInvoice(file=b"second", filename="OC-2021-05.pdf", hash="h"),
+                                 self.mongodb_test)
+        second = await find_invoice_pdf("OC-2021-05", self.mongodb_test)
+        assert (second.hash, second.length) == ("h", 6)
+        assert [second.file_id] == list(bucket.files)
+
+        # Unknown invoice: nothing uploaded
+        assert not (await update_pdf_invoice("OC-2021-06", FileInvoice(file=b"pdf", filename="OC-2021-06.pdf"),
+                                             self.mongodb_test)).id
+        assert await find_invoice_pdf("OC-2021-06", self.mongodb_test) is None
+        assert 1 == len(bucket.files)
+
+        # Deleted with its invoice
+        assert 1 == await delete_invoice("OC-2021-05", self.mongodb_test)
+        assert {} == bucket.files
+
+    @pytest.mark.asyncio
+    async def test_find_invoice_pdf_legacy(self, bucket):
+        await self.mongodb_test.invoice_coll.insert_one({"id": "OC-2021-05", "date": "2021-05",
+                                                         "file": {"file": b"legacy", "filename": "OC-2021-05.pdf"}})
+
+        # The pdf embedded in the invoice is moved to GridFS
+        pdf = await find_invoice_pdf("OC-2021-05", self.mongodb_test)
+        assert (pdf.filename, pdf.length, pdf.hash) == ("OC-2021-05.pdf", 6, hashlib.sha256(b"legacy").hexdigest())
+        assert b"legacy" == bucket.files[pdf.file_id]
+        invoice = await self.mongodb_test.invoice_coll.find_one({"id": "OC-2021-05"})
+        assert "file" not in invoice["file"]
+        assert pdf == await find_invoice_pdf("OC-2021-05", self.mongodb_test)
+
+        await delete_invoice("OC-2021-05", self.mongodb_test)
+        assert {} == bucket.files
+
+    @pytest.mark.asyncio
+    async def test_stream_invoice_pdf(self, bucket):
+        file_id = await bucket.upload_from_stream("OC-2021-05.pdf", b"0123456789")
+
+        async def read(*args) -> list:
+            return [chunk async for chunk in stream_invoice_pdf(await open_invoice_pdf(file_id, self.mongodb_test),
+                                                                *args)]
+
+        assert [b"0123", b"4567", b"89"] == await read()
+        assert [b"2345", b"6"] == await read(2, 6)
+        assert [b"9"] == await read(9, 9)
+        assert [b"89"] == await read(8)
+        assert await open_invoice_pdf(ObjectId(), self.mongodb_test) is None
@@ -0,0 +1,127 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.crud import session as session_crud
+from app.crud.rollup import refresh_rollup, find_rollup, session_months, student_months
+from app.crud.session import create_session, delete_session, upsert_sessions
+from app.crud.student import create_student, delete_student
+from app.schema.sessions import SessionModel
+from app.tests.tests_crud import MockedDoc
+
+
+class TestRollup(MockedDoc):
+
+    @pytest.fixture(scope="session")
+    def event_loop(self):
+        return asyncio.get_event_loop()
+
+    async def groups(self, month: str):
+        return sorted([(group["projectLevel"], group["status"], group["student_status"], group["count"])
+                       async for group in find_rollup(month, self.mongodb_test)])
+
+    @pytest.mark.asyncio
+    async def test_refresh_rollup(self):
+        await create_student(self.multiple_student[1], self.mongodb_test)
+        completed = SessionModel(**self.multiple_session[1])
+        absent = SessionModel(**{**self.multiple_session[1], "id": 9995, "status": "marked student as absent"})
+
+        # Insert
+        await create_session(completed, self.mongodb_test)
+        await create_session(absent, self.mongodb_test)
+        assert [("3", "completed", "testStatus", 1),
+                ("3", "marked student as absent", "testStatus", 1)] == await self.groups("2021-05")
+
+        # Status change
+        await create_session(SessionModel(**{**absent.dict(), "status": "completed"}), self.mongodb_test)
+        assert [("3", "completed", "testStatus", 2)] == await self.groups("2021-05")
+
+        # Delete
+        await delete_session(absent.id, self.mongodb_test)
+        assert [("3", "completed", "testStatus", 1)] == await self.groups("2021-05")
+        await delete_session(completed.id, self.mongodb_test)
+        assert [] == await self.groups("2021-05")
+
+        await delete_student(self.multiple_student[1].id, self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_find_rollup_missing(self, monkeypatch):
+        await create_student(self.multiple_student[1], self.mongodb_test)
+        await create_session(SessionModel(**self.multiple_session[1]), self.mongodb_test)
+
+        await self.mongodb_test.rollup_coll.delete_many({"yearmonth": "2021-05"})
+        assert [("3", "completed", "testStatus", 1)] == await self.groups("2021-05")
+        assert 1 == await self.mongodb_test.rollup_coll.count_documents({"yearmonth": "2021-05"})
+
+        # Concurrent refreshes of the same month leave it whole, even when they interleave
+        bulk_write = self.mongodb_test.rollup_coll.bulk_write
+
+        async def slow_bulk_write(*args, **kwargs):
+            result = await bulk_write(*args, **kwargs)
+            await asyncio.sleep(0.01)
+            return result
+
+        monkeypatch.setattr(self.mongodb_test.rollup_coll, "bulk_write", slow_bulk_write)
+        await asyncio.gather(*[refresh_rollup(months, self.mongodb_test)
+                               for months in (["2021-05"], ["2021-04", "2021-05"], ["2021-05"])])
+        assert 1 == await self.mongodb_test.rollup_coll.count_documents({"yearmonth": "2021-05"})
+
+        await delete_session(self.multiple_session[1]["id"], self.mongodb_test)
+        await delete_student(self.multiple_student[1].id, self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_find_rollup_empty(self, monkeypatch):
+        await self.mongodb_test.rollup_coll.delete_many({"yearmonth": "2020-01"})
+        assert [] == await self.groups("2020-01")
+
+        # The empty month is kept, the next reads do not aggregate it again
+        def aggregate(*args, **kwargs):
+            raise AssertionError("month aggregated again")
+
+        monkeypatch.setattr(self.mongodb_test.session_coll, "aggregate", aggregate)
+        assert [] == await self.groups("2020-01")
+        assert 1 == await self.mongodb_test.rollup_coll.count_documents({"yearmonth": "2020-01", "count": 0})
+
+    @pytest.mark.asyncio
+    async def test_refresh_changed_months(self, monkeypatch):
+        sessions = [SessionModel(**self.multiple_session[1]),
+                    SessionModel(**{**self.multiple_session[1], "id": 9995, "sessionDate": "2021-04-11T11:00:00Z"})]
+        refreshed = []
+
+        async def refresh(months, mongo):
+            refreshed.append(months)
+
+        monkeypatch.setattr(session_crud, "refresh_rollup", refresh)
+        await upsert_sessions(sessions, self.mongodb_test)
+        assert [["2021-04", "2021-05"]] == refreshed
+
+        # Only the month of the session with a new status
+        refreshed.clear()
+        sessions[1].status = "marked student as absent"
+        await upsert_sessions(sessions, self.mongodb_test)
+        assert [["2021-04"]] == refreshed
+
+        refreshed.clear()
+        await upsert_sessions(sessions, self.mongodb_test)
+        await create_session(sessions[0], self.mongodb_test)
+        assert [] == refreshed
+
+        for session in sessions:
+            await delete_session(session.id, self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_months(self):
+        sessions = [SessionModel(**session) for session in self.multiple_session]
+        assert ["2021-05"] == session_months(sessions)
+        assert ["2021-04", "2021-05"] == session_months([{"sessionDate": datetime(2021, 4, 30, 23)},
+                                                         {"sessionDate": datetime(2021, 5, 1)},
+                                                         {"sessionDate": ""}])
+
+        for session in sessions:
+            await create_session(session, self.mongodb_test)
+        # Only the billable sessions count
+        assert ["2021-05"] == await student_months([7777], self.mongodb_test)
+        assert [] == await student_months([7778], self.mongodb_test)
+        for session in sessions:
+            await delete_session(session.id, self.mongodb_test)
@@ -3,8 +3,9 @@ from datetime import datetime
 
 import pytest
 
-from app.crud.session import create_session, delete_session, find_session_by_id, find_session_by_date
-from app.schema.sessions import SessionModel, SessionOutModel
+from app.crud.session import create_session, delete_session, delete_sessions, find_session_by_id, find_session_by_date, \
+    upsert_sessions
+from app.schema.sessions import SessionModel, SessionOutModel, SessionBulkOutModel
 from app.tests.tests_crud import MockedDoc
 
 
@@ -42,3 +43,24 @@ class TestSession(MockedDoc):
         assert SessionOutModel(**data.dict()) == await find_session_by_date(data.sessionDate.isoformat(),
                                                                             self.mongodb_test)
         await delete_session(data["id"], self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_upsert_sessions(self):
+        sessions = [SessionModel(**s) for s in self.multiple_session]
+        assert SessionBulkOutModel(inserted=4) == await upsert_sessions(sessions, self.mongodb_test)
+        sessions[0].status = "completed"
+        assert SessionBulkOutModel(modified=1, unchanged=3) == await upsert_sessions(sessions, self.mongodb_test)
+        assert "completed" == (await find_session_by_id(sessions[0].id, self.mongodb_test)).status
+        assert SessionBulkOutModel() == await upsert_sessions([], self.mongodb_test)
+        for s in self.multiple_session:
+            await delete_session(s["id"], self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_delete_sessions(self):
+        await upsert_sessions([SessionModel(**s) for s in self.multiple_session], self.mongodb_test)
+        assert 2 == await delete_sessions([9999, 9998, 1234], self.mongodb_test)
+        assert not (await find_session_by_id(9999, self.mongodb_test)).id
+        assert 9997 == (await find_session_by_id(9997, self.mongodb_test)).id
+        assert 0 == await delete_sessions([], self.mongodb_test)
+        for s in self.multiple_session:
+            await delete_session(s["id"], self.mongodb_test)
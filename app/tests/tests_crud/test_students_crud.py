@@ -1,9 +1,11 @@
 import asyncio
+from datetime import datetime, timedelta
 
 import pytest
 
 from app.crud.session import create_session, delete_session
-from app.crud.student import create_student, \
+from app.crud.student import create_student, create_students, find_unknown_students, \
+    find_students_to_refresh, update_student_profile, \
     find_student_with_id, \
     delete_student, \
     fetch_all_students, get_student_all_sessions, get_distinct
@@ -105,3 +107,36 @@ class TestStudent(MockedDoc):
 
         for s in self.multiple_session:
             await delete_session(s["id"], self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_create_students(self):
+        await create_student(self.multiple_student[0], self.mongodb_test)
+        assert [7777] == await find_unknown_students([7779, 7777], self.mongodb_test)
+
+        assert [self.multiple_student[1]] == await create_students(self.multiple_student, self.mongodb_test)
+        assert [] == await find_unknown_students([7779, 7777], self.mongodb_test)
+        assert [] == await create_students([], self.mongodb_test)
+        for r in self.multiple_student:
+            await delete_student(r.id, self.mongodb_test)
+
+    @pytest.mark.asyncio
+    async def test_refresh_students(self):
+        for r in self.multiple_student:
+            await create_student(r, self.mongodb_test)
+        assert [] == await find_students_to_refresh(timedelta(days=1), self.mongodb_test)
+        assert [7777, 7779] == sorted(await find_students_to_refresh(timedelta(0), self.mongodb_test))
+
+        await create_session(SessionModel(**self.multiple_session[1]), self.mongodb_test)
+        await self.mongodb_test.student_coll.update_many({}, {"$set": {"refreshed_at": datetime(2021, 5, 10)}})
+        assert [7777] == await find_students_to_refresh(datetime.utcnow() - datetime(2021, 5, 1),
+                                                        self.mongodb_test)
+
+        data = self.multiple_student[1].dict()
+        assert not await update_student_profile(UserModel(**data), self.mongodb_test)
+        assert [] == await find_students_to_refresh(datetime.utcnow() - datetime(2021, 5, 1), self.mongodb_test)
+        assert await update_student_profile(UserModel(**{**data, "status": "Auto-financé"}), self.mongodb_test)
+        assert not await update_student_profile(UserModel(**{**data, "id": 9999}), self.mongodb_test)
+
+        await delete_session(self.multiple_session[1]["id"], self.mongodb_test)
+        for r in self.multiple_student:
+            await delete_student(r.id, self.mongodb_test)
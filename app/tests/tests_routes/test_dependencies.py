@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.core.cache import token_cache, stale_token_cache
+from app.core.credentials import credentials
+from app.core.http import oc_client
+from app.routes.dependencies import get_me
+from app.services.oc_api import login_oc
+
+me = {"id": 1, "email": "mentor@gmail.com"}
+
+
+@pytest.fixture
+def oc_api(monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path.endswith("/login_ajax"):
+            return httpx.Response(200, json={"csrf": "state"}, headers={"set-cookie": "PHPSESSID=before"})
+        if request.url.path.endswith("/login_check"):
+            return httpx.Response(200, headers=[("set-cookie", "PHPSESSID=cookie"),
+                                                ("set-cookie", "access_token=token")])
+        return httpx.Response(200, json=me)
+
+    async def save(id, cookie, token):
+        pass
+
+    monkeypatch.setattr(oc_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(oc_client, "retries", 0)
+    monkeypatch.setattr(credentials, "get_cookie", lambda id: "cookie")
+    monkeypatch.setattr(credentials, "save", save)
+    token_cache.clear()
+    stale_token_cache.clear()
+    yield calls
+    token_cache.clear()
+    stale_token_cache.clear()
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_get_me_cache(oc_api):
+    user = await get_me("token")
+    assert (user.id, user.username, user.cookie) == (1, "mentor@gmail.com", "cookie")
+    assert await get_me("token") == user
+    assert ["/me"] == [path for path in oc_api if path.endswith("/me")]
+
+
+@pytest.mark.asyncio
+async def test_get_me_cache_expire(oc_api, monkeypatch):
+    monkeypatch.setattr(token_cache, "ttl", 0.05)
+    await get_me("token")
+    time.sleep(0.06)
+    await get_me("token")
+    assert 2 == len([path for path in oc_api if path.endswith("/me")])
+
+
+@pytest.mark.asyncio
+async def test_get_me_cache_cleared_on_login(oc_api):
+    await get_me("token")
+    assert len(token_cache) == 1
+    assert {"state": True, "token": "token"} == await login_oc("mentor@gmail.com", "password")
+    assert len(token_cache) == 0
+    oc_api.clear()
+    await get_me("token")
+    assert ["/me"] == oc_api
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.db import mongodb
+from app.main import app
+from app.routes import invoice as invoice_routes
+from app.services.pdf import pdf_renderer
+from app.tests.tests_crud import MockedDoc
+from app.tests.tests_crud.test_invoices_crud import GridFSBucket
+from app.tests.tests_services.test_html import invoice_template
+
+client = TestClient(app)
+
+routes = "invoices/"
+
+invoice = {"date": "2021-05",
+           "status": "Draft",
+           "id": "OC-TEST-2021-05",
+           "total": 60,
+           "item": [{"type": "mentoring", "projectLevel": "3", "status": "completed",
+                     "student_status": "Auto-financé", "count": 2, "unit_price": 30, "price": 60}]}
+
+
+@pytest.fixture
+def invoices(monkeypatch):
+    coll = MockedDoc.mongodb_test.invoice_coll
+    monkeypatch.setattr(mongodb, "invoice_coll", coll)
+    monkeypatch.setattr(mongodb, "_pdf_bucket", GridFSBucket())
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(coll.delete_many({}))
+    loop.run_until_complete(coll.insert_one(dict(invoice)))
+    yield invoice["id"]
+    loop.run_until_complete(coll.delete_many({}))
+
+
+@pytest.fixture
+def renders(monkeypatch, tmp_path):
+    renders = []
+    monkeypatch.setattr(invoice_routes, "invoice_template",
+                        invoice_template(tmp_path, "{{ invoice.id }} {{ invoice.status }} {{ invoice.total }}"))
+
+    async def render(html):
+        renders.append(html)
+        return b"%PDF-" + str(len(renders)).encode()
+
+    monkeypatch.setattr(pdf_renderer, "render", render)
+    return renders
+
+
+def test_create_pdf_invoice_cached(invoices, renders):
+    response = client.put(routes + invoices + "/html/pdf")
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1"
+    etag = response.headers["ETag"]
+
+    # Same content, the pdf already rendered is sent
+    response = client.put(routes + invoices + "/html/pdf")
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1"
+    assert response.headers["ETag"] == etag
+    assert len(renders) == 1
+
+    # Content changed, the pdf is rendered again
+    asyncio.get_event_loop().run_until_complete(mongodb.invoice_coll.update_one({"id": invoices},
+                                                                                {"$set": {"status": "Sent"}}))
+    response = client.put(routes + invoices + "/html/pdf")
+    assert response.content == b"%PDF-2"
+    assert response.headers["ETag"] != etag
+
+
+def test_get_pdf_invoice_not_modified(invoices, renders):
+    etag = client.put(routes + invoices + "/html/pdf").headers["ETag"]
+
+    response = client.get(routes + invoices + "/pdf", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    response = client.get(routes + invoices + "/pdf", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.content == b"%PDF-1"
+    assert response.headers["ETag"] == etag
@@ -1,6 +1,13 @@
+import asyncio
+import json
+
+import pytest
 from fastapi.testclient import TestClient
 
+from app.core.db import mongodb
 from app.main import app
+from app.routes.dependencies import NEXT_CURSOR_HEADER
+from app.tests.tests_crud import MockedDoc
 
 client = TestClient(app)
 
@@ -57,3 +64,46 @@ def test_get_student_sessions():
 
     response = client.get(routes+"7779")
     assert response.status_code == 404
+
+
+@pytest.fixture
+def students(monkeypatch):
+    coll = MockedDoc.mongodb_test.student_coll
+    monkeypatch.setattr(mongodb, "student_coll", coll)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(coll.delete_many({}))
+    loop.run_until_complete(coll.insert_many([student.dict() for student in MockedDoc.multiple_student]))
+    yield [student.id for student in MockedDoc.multiple_student]
+    loop.run_until_complete(coll.delete_many({}))
+
+
+def test_get_students_pages(students):
+    response = client.get(routes, params={"limit": 1})
+    assert response.status_code == 200
+    assert [student["id"] for student in response.json()] == students[:1]
+    cursor = response.headers[NEXT_CURSOR_HEADER]
+
+    response = client.get(routes, params={"limit": 1, "cursor": cursor})
+    assert response.status_code == 200
+    assert [student["id"] for student in response.json()] == students[1:]
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_get_students_last_page(students):
+    response = client.get(routes, params={"limit": len(students)})
+    assert response.status_code == 200
+    assert len(response.json()) == len(students)
+    assert NEXT_CURSOR_HEADER not in response.headers
+
+
+def test_get_students_invalid_cursor(students):
+    response = client.get(routes, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_export_students(students):
+    response = client.get(routes + "export")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == students
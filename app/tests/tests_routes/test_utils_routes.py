@@ -0,0 +1,25 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.credentials import credentials
+from app.routes.utils import post_session_event
+
+event = {"event": "invitee.created",
+         "time": "2021-05-11T10:00:00Z",
+         "payload": {"event": {"start_time": "2021-05-12T10:00:00Z"},
+                     "invitee": {"name": "student", "email": "student@gmail.com"}}}
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_post_session_event_no_token(monkeypatch):
+    monkeypatch.setattr(credentials, "get_token", lambda id=None: None)
+    with pytest.raises(HTTPException) as error:
+        await post_session_event(event)
+    assert error.value.status_code == 503
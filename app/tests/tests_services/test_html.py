@@ -0,0 +1,41 @@
+import pytest
+from jinja2 import TemplateNotFound
+
+from app.schema.invoice import InvoiceItem, InvoiceOutModel
+from app.services.html import InvoiceTemplate
+
+
+def invoice_template(path, source: str) -> InvoiceTemplate:
+    (path / "invoice.html").write_text(source)
+    template = InvoiceTemplate(str(path), "invoice.html", 10, 60)
+    template.load()
+    return template
+
+
+def test_render(tmp_path):
+    template = invoice_template(tmp_path, "{{ invoice.id }} {{ date }}{% for item in invoice.item %} {{ item.type }}"
+                                          "{% endfor %} {{ invoice.status }}")
+    invoice = InvoiceOutModel(id="OC-2021-05", date="2021-05", item=[InvoiceItem(type="mentoring")])
+    html, etag = template.render(invoice, "01/06/2021")
+    assert html == "OC-2021-05 01/06/2021 mentoring Draft"
+    assert etag == template.etag(invoice, "01/06/2021")
+
+    # Same version of the invoice, the HTML comes from the cache
+    (tmp_path / "invoice.html").write_text("changed")
+    assert template.render(invoice, "01/06/2021") == (html, etag)
+    assert template.etag(invoice, "02/06/2021") != etag
+    sent = invoice.copy(update={"status": "Sent"})
+    assert template.render(sent, "01/06/2021")[0] == "OC-2021-05 01/06/2021 mentoring Sent"
+
+    # A new template is only read on load, with a new version
+    version = template.version
+    template.load()
+    assert template.version != version
+    assert template.render(invoice, "01/06/2021")[0] == "changed"
+
+
+def test_missing_template(tmp_path):
+    template = InvoiceTemplate(str(tmp_path), "invoice.html", 10, 60)
+    assert template.load() is None
+    with pytest.raises(TemplateNotFound):
+        template.render(InvoiceOutModel(id="OC-2021-05"), "01/06/2021")
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.utils import Progress
+from app.crud.job import find_job
+from app.schema.jobs import JobStatusEnum
+from app.services.jobs import JobRunner
+from app.tests.tests_crud import MockedDoc
+
+
+def test_progress():
+    counters = {}
+    progress = Progress(counters)
+    progress.add("pages_fetched")
+    progress.add("pages_fetched")
+    progress.add("sessions_upserted", 40)
+    assert counters == {"pages_fetched": 2, "sessions_upserted": 40}
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_job_runner():
+    runner = JobRunner(MockedDoc.mongodb_test)
+
+    async def sync(progress):
+        progress.add("pages_fetched", 3)
+        return {"sessions": 60}
+
+    job = await runner.submit("sync_sessions", sync)
+    await asyncio.sleep(0.1)
+    job = await runner.get(job.id)
+    assert job.status == JobStatusEnum.done
+    assert job.result == {"sessions": 60}
+    assert job.progress == {"pages_fetched": 3}
+    assert await runner.cancel(job.id) is None
+
+    async def fail(progress):
+        raise HTTPException(status_code=404, detail="Issue when fetching")
+
+    job = await runner.submit("sync_sessions", fail)
+    await asyncio.sleep(0.1)
+    job = await runner.get(job.id)
+    assert (job.status, job.error) == (JobStatusEnum.failed, "Issue when fetching")
+
+    async def wait(progress):
+        progress.add("sessions_cancelled")
+        await asyncio.sleep(10)
+
+    job = await runner.submit("cancel_sessions", wait)
+    await asyncio.sleep(0.1)
+    assert (await runner.get(job.id)).status == JobStatusEnum.running
+    job = await runner.cancel(job.id)
+    assert job.status == JobStatusEnum.cancelled
+    assert (await runner.get(job.id)).progress == {"sessions_cancelled": 1}
+    assert await runner.get("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_cancel_before_start():
+    runner = JobRunner(MockedDoc.mongodb_test)
+
+    async def sync(progress):
+        progress.add("pages_fetched")
+
+    # Cancelled before the task runs its first step
+    job = await runner.submit("sync_sessions", sync)
+    job = await runner.cancel(job.id)
+    assert job.status == JobStatusEnum.cancelled
+    assert job.finished_at is not None
+    assert (runner._jobs, runner._tasks) == ({}, {})
+    assert (await find_job(job.id, MockedDoc.mongodb_test)).status == JobStatusEnum.cancelled
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import re
+from datetime import datetime
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.http import oc_client
+from app.core.utils import Progress
+from app.services.oc_api import StudentStatusParser, fetch_all_sessions
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+expected_status = {"dashboard_self_funded.html": "Auto-financé",
+                   "dashboard_funded_multiline.html": "Financé par un tiers",
+                   "dashboard_no_status.html": None,
+                   "dashboard_empty_status.html": "Financé par un tiers",
+                   "dashboard_late_status.html": "Auto-financé"}
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def search_whole_page(html: str):
+    """
+    Former scraping: the whole page without new lines
+    """
+    match = re.search(r'<div class="mentorshipStudent__details oc-typography-body1"><p>([^<]+)</p>',
+                      html.replace('\n', ''))
+    return match.group(1).strip() if match else None
+
+
+def parse_chunks(html: str, size: int):
+    parser = StudentStatusParser()
+    for start in range(0, len(html), size):
+        if parser.feed(html[start:start + size]) is not None:
+            break
+    return parser.status
+
+
+@pytest.mark.parametrize("name", sorted(expected_status))
+@pytest.mark.parametrize("size", [1, 7, 64, 4096, 1_000_000])
+def test_student_status_parser(name, size):
+    html = read_fixture(name)
+    assert parse_chunks(html, size) == expected_status[name] == search_whole_page(html)
+
+
+def test_student_status_parser_buffer():
+    parser = StudentStatusParser()
+    html = read_fixture("dashboard_late_status.html")
+    status_at = html.index('<div class="mentorshipStudent__details')
+    parser.feed(html[:status_at])
+    assert len(parser._buffer) < len(StudentStatusParser.prefix)
+    parser.feed(html[status_at:status_at + len(StudentStatusParser.prefix) + 3])
+    assert parser.status is None
+    assert parser.feed(html[status_at + len(StudentStatusParser.prefix) + 3:]) == "Auto-financé"
+
+
+def sessions_api(total: int, missing: int = None, requested: list = None):
+    """
+    Handler standing for the sessions of the OC API, pages given by the Range header
+    """
+    def handler(request):
+        start, end = (int(bound) for bound in request.headers["Range"].split("=")[1].split("-"))
+        if requested is not None:
+            requested.append(start)
+        if start >= total:
+            return httpx.Response(416)
+        if start == missing:
+            return httpx.Response(404)
+        # The last session of a page is also the first of the next one when sessions move meanwhile
+        sessions = [{"id": i} for i in range(max(0, start - 1), min(end, total - 1) + 1)]
+        return httpx.Response(206, json=sessions, headers={"Content-Range": f"items {start}-{end}/{total}"})
+    return handler
+
+
+@pytest.fixture
+def oc_api(monkeypatch):
+    def mock(handler):
+        monkeypatch.setattr(oc_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return mock
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_sessions(oc_api):
+    requested = []
+    oc_api(sessions_api(95, requested=requested))
+    progress = Progress()
+    sessions = await fetch_all_sessions(1, "Bearer token", concurrency=2, progress=progress)
+    assert [session["id"] for session in sessions] == list(range(95))
+    assert sorted(requested) == [0, 20, 40, 60, 80]
+    assert progress.counters == {"pages_fetched": 5}
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_sessions_empty(oc_api):
+    oc_api(sessions_api(0))
+    assert await fetch_all_sessions(1, "Bearer token") == []
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_sessions_missing_page(oc_api):
+    oc_api(sessions_api(95, missing=40))
+    with pytest.raises(HTTPException) as error:
+        await fetch_all_sessions(1, "Bearer token")
+    assert error.value.status_code == 502
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_sessions_first_page_error(oc_api):
+    oc_api(sessions_api(95, missing=0))
+    with pytest.raises(HTTPException) as error:
+        await fetch_all_sessions(1, "Bearer token", after=datetime(2021, 5, 1))
+    assert error.value.status_code == 502
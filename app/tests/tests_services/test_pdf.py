@@ -0,0 +1,55 @@
+import asyncio
+import os
+import stat
+
+import pdfkit
+import pytest
+
+from app.services.pdf import PDFRenderer, RenderQueueFullError
+
+
+def fake_wkhtmltopdf(path, script: str):
+    """
+    Executable standing for wkhtmltopdf
+    """
+    with open(path, "w") as file:
+        file.write("#!/bin/sh\n" + script + "\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return pdfkit.configuration(wkhtmltopdf=str(path))
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_render(tmp_path):
+    renderer = PDFRenderer(workers=2, queue_size=0, timeout=5, retry_after=1)
+    renderer._configuration = fake_wkhtmltopdf(tmp_path / "cat", "cat")
+    assert await renderer.render("<p>Facture é</p>") == "<p>Facture é</p>".encode()
+
+    renderer._configuration = fake_wkhtmltopdf(tmp_path / "fail", "echo 'Error: broken' >&2; exit 1")
+    with pytest.raises(IOError):
+        await renderer.render("<p>Facture</p>")
+
+
+@pytest.mark.asyncio
+async def test_render_timeout(tmp_path):
+    renderer = PDFRenderer(workers=1, queue_size=0, timeout=0.2, retry_after=1)
+    renderer._configuration = fake_wkhtmltopdf(tmp_path / "slow", "exec sleep 5")
+    with pytest.raises(asyncio.TimeoutError):
+        await renderer.render("<p>Facture</p>")
+    assert renderer._pending == 0
+
+
+@pytest.mark.asyncio
+async def test_render_queue_full(tmp_path):
+    renderer = PDFRenderer(workers=1, queue_size=1, timeout=5, retry_after=3)
+    renderer._configuration = fake_wkhtmltopdf(tmp_path / "slow", "sleep 0.3; cat")
+    renders = [asyncio.create_task(renderer.render("<p>{}</p>".format(i))) for i in range(2)]
+    await asyncio.sleep(0.1)
+    with pytest.raises(RenderQueueFullError) as error:
+        await renderer.render("<p>2</p>")
+    assert error.value.retry_after == 3
+    assert await asyncio.gather(*renders) == [b"<p>0</p>", b"<p>1</p>"]
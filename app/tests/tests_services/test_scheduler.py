@@ -0,0 +1,17 @@
+from app.services.scheduler import SyncScheduler
+
+
+def test_next_delay():
+    scheduler = SyncScheduler(interval=3600, jitter=0, backoff_base=60, backoff_max=600)
+    assert scheduler.next_delay() == 3600
+
+    delays = []
+    for failures in range(1, 6):
+        scheduler.metrics.consecutive_failures = failures
+        delays.append(scheduler.next_delay())
+    assert delays == [60, 120, 240, 480, 600]
+
+
+def test_next_delay_jitter():
+    scheduler = SyncScheduler(interval=3600, jitter=0.1, backoff_base=60, backoff_max=600)
+    assert all(3240 <= scheduler.next_delay() <= 3960 for _ in range(100))
@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.http import oc_client
+from app.schema.authentification import UserAuth
+from app.schema.sessions import SessionModel
+from app.schema.sync import SyncStateModel, PendingSessionModel
+from app.services import sync
+from app.services.sync import sync_lower_bound, update_sync_state, enrich_students, refresh_students, sync_sessions
+
+slack = timedelta(hours=settings.SYNC_SLACK_HOURS)
+user = UserAuth(username="mentor@mail.com", token="token", id=1, cookie="cookie")
+
+
+def test_sync_lower_bound():
+    assert sync_lower_bound(SyncStateModel(id=1)) is None
+
+    state = SyncStateModel(id=1,
+                           last_session_date=datetime(2021, 5, 20),
+                           last_session_id=9999,
+                           last_sync=datetime(2021, 5, 15))
+    assert sync_lower_bound(state) == datetime(2021, 5, 15) - slack
+
+    state.pending = [PendingSessionModel(id=9998, sessionDate=datetime(2021, 5, 10))]
+    assert sync_lower_bound(state) == datetime(2021, 5, 10) - slack
+
+
+def test_update_sync_state():
+    sessions = [SessionModel(id=9999, sessionDate="2021-05-11T11:00:00Z", status="completed"),
+                SessionModel(id=9997, sessionDate="2021-05-12T11:00:00Z", status="pending"),
+                SessionModel(id=9998, sessionDate="2021-05-12T11:00:00Z", status="canceled")]
+    state = update_sync_state(SyncStateModel(id=1), sessions, datetime(2021, 5, 11))
+    assert state.last_session_date == datetime(2021, 5, 12, 11)
+    assert state.last_session_id == 9998
+    assert state.last_sync == datetime(2021, 5, 11)
+    assert state.pending == [PendingSessionModel(id=9997, sessionDate=datetime(2021, 5, 12, 11))]
+
+    assert update_sync_state(state, [], datetime(2021, 5, 13)).last_session_id == 9998
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+def student_type(errors: dict):
+    """
+    Stands for get_student_type, raising the error given for a student
+    """
+    async def get_student_type(student_id, token, cookie):
+        if student_id in errors:
+            raise errors[student_id]
+        return {"id": student_id, "displayName": str(student_id), "status": "Auto-financé"}
+    return get_student_type
+
+
+async def as_result(value):
+    return value
+
+
+@pytest.mark.asyncio
+async def test_enrich_students_errors(monkeypatch):
+    created = []
+
+    async def create_students(students):
+        created.extend(students)
+        return students
+
+    monkeypatch.setattr(sync, "get_distinct", lambda: as_result([1, 2, 3, 4, 5]))
+    monkeypatch.setattr(sync, "find_unknown_students", lambda ids: as_result(ids))
+    monkeypatch.setattr(sync, "create_students", create_students)
+    monkeypatch.setattr(sync, "get_student_type", student_type({2: httpx.ReadTimeout("timeout"),
+                                                                 3: CircuitOpenError("website", 30),
+                                                                 4: RuntimeError("no status")}))
+    assert [1, 5] == [student.id for student in await enrich_students(user)]
+    assert [1, 5] == [student.id for student in created]
+
+
+@pytest.mark.asyncio
+async def test_refresh_students_errors(monkeypatch):
+    updated = []
+
+    async def update_student_profile(student):
+        updated.append(student.id)
+        return True
+
+    monkeypatch.setattr(sync, "find_students_to_refresh", lambda ttl: as_result([1, 2, 3, 4, 5]))
+    monkeypatch.setattr(sync, "update_student_profile", update_student_profile)
+    monkeypatch.setattr(sync, "get_student_type", student_type({2: httpx.ConnectError("refused"),
+                                                                 3: RuntimeError("no status"),
+                                                                 5: httpx.ReadTimeout("timeout")}))
+    assert 2 == await refresh_students(user, rate=1000)
+    assert [1, 4] == updated
+
+    # OC unavailable, the remaining students wait for the next refresh
+    updated.clear()
+    monkeypatch.setattr(sync, "get_student_type", student_type({2: CircuitOpenError("website", 30)}))
+    assert 1 == await refresh_students(user, rate=1000)
+    assert [1] == updated
+
+
+@pytest.mark.asyncio
+async def test_sync_sessions_oc_error(monkeypatch):
+    state = SyncStateModel(id=1,
+                           last_session_date=datetime(2021, 5, 20),
+                           last_session_id=9999,
+                           last_sync=datetime(2021, 5, 15),
+                           pending=[PendingSessionModel(id=9998, sessionDate=datetime(2021, 5, 10))])
+    states = {1: state.copy(deep=True)}
+
+    async def save_sync_state(new_state):
+        states[new_state.id] = new_state
+        return new_state
+
+    monkeypatch.setattr(sync, "find_sync_state", lambda id: as_result(states[id].copy(deep=True)))
+    monkeypatch.setattr(sync, "save_sync_state", save_sync_state)
+    monkeypatch.setattr(oc_client, "_client",
+                        httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503))))
+    monkeypatch.setattr(oc_client, "retries", 0)
+
+    # The first page fails: the pending sessions and the high-water mark are kept for the next sync
+    with pytest.raises(HTTPException) as error:
+        await sync_sessions(user)
+    assert error.value.status_code == 502
+    assert states == {1: state}
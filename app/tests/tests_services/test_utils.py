@@ -0,0 +1,45 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.breaker import CircuitOpenError
+from app.core.utils import Progress
+from app.schema.sessions import SessionOutModel
+from app.services import utils
+from app.services.utils import cancel_sessions
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.mark.asyncio
+async def test_cancel_sessions(monkeypatch):
+    request = httpx.Request("POST", "https://openclassrooms.com")
+
+    async def delete_session_oc(session_id, cookie):
+        if session_id == 3:
+            raise httpx.ConnectError("connection refused", request=request)
+        if session_id == 4:
+            raise CircuitOpenError("website", 30)
+        return httpx.Response(200 if session_id == 1 else 403, text="forbidden", request=request)
+
+    deleted = []
+
+    async def delete_sessions(ids):
+        deleted.extend(ids)
+        return len(ids)
+
+    monkeypatch.setattr(utils, "delete_session_oc", delete_session_oc)
+    monkeypatch.setattr(utils, "delete_sessions", delete_sessions)
+    progress = Progress()
+    result = await cancel_sessions([SessionOutModel(id=id) for id in (1, 2, 3, 4)], "cookie", progress=progress)
+
+    assert [1] == [session.id for session in result.succeeded] == deleted
+    assert [2, 3, 4] == [failure.id for failure in result.failed]
+    assert "OC returned 403: forbidden" == result.failed[0].reason
+    assert "ConnectError" in result.failed[1].reason
+    assert "website unavailable" in result.failed[2].reason
+    assert 1 == progress.counters["sessions_cancelled"]